@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_caches():
+    """Под pytest кеши тестов тоже хранятся во временном каталоге."""
+    from core.test_runner import isolated_caches
+
+    with isolated_caches():
+        yield
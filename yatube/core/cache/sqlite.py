@@ -0,0 +1,203 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+    'expires REAL, accessed REAL NOT NULL) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+)
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite в режиме WAL, общий для процессов одного хоста.
+
+    LOCATION - путь к файлу базы. Размер ограничен MAX_ENTRIES:
+    при переполнении удаляются давно не читавшиеся записи (LRU).
+    incr() выполняется в транзакции BEGIN IMMEDIATE и атомарен
+    между процессами.
+    """
+
+    # Как часто процесс проверяет переполнение, в операциях записи.
+    cull_check = 100
+    # Время последнего чтения обновляется не чаще, секунд.
+    touch_granularity = 1
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def _db(self):
+        # Соединение нельзя наследовать после fork, поэтому оно своё
+        # у каждого процесса и потока.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self.location, timeout=30, isolation_level=None
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                db.execute(statement)
+            local.db, local.pid = db, os.getpid()
+        return local.db
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        now = time.time()
+        rows = self._db.execute(
+            'SELECT key, value, expires, accessed FROM cache '
+            'WHERE key IN ({})'.format(','.join('?' * len(keys))),
+            list(keys),
+        ).fetchall()
+        found = {}
+        stale = []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                continue
+            found[keys[key]] = pickle.loads(value)
+            if accessed < now - self.touch_granularity:
+                stale.append((now, key))
+        if stale:
+            self._db.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?', stale
+            )
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        self._db.executemany(
+            'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+            [
+                (
+                    self._key(key, version),
+                    pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                    expires,
+                    now,
+                )
+                for key, value in data.items()
+            ],
+        )
+        self._maybe_cull(len(data))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now)
+            )
+            added = db.execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?)',
+                (
+                    key,
+                    pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                    self.get_backend_timeout(timeout),
+                    now,
+                ),
+            ).rowcount
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        self._maybe_cull(added)
+        return bool(added)
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            db.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key),
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return bool(self._db.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), self._key(key, version),
+             time.time()),
+        ).rowcount)
+
+    def has_key(self, key, version=None):
+        return self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._key(key, version), time.time()),
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        self._db.executemany(
+            'DELETE FROM cache WHERE key = ?',
+            [(self._key(key, version),) for key in keys],
+        )
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def _maybe_cull(self, written):
+        self._writes += written
+        if self._writes < self.cull_check:
+            return
+        self._writes = 0
+        self._cull()
+
+    def _cull(self):
+        db = self._db
+        db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            excess = count - self._max_entries
+            if self._cull_frequency:
+                excess += self._max_entries // self._cull_frequency
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY accessed LIMIT ?)', (excess,)
+            )
@@ -0,0 +1,208 @@
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+STAMP_KEY = 'tiered:stamp:{}'
+GLOBAL_NAMESPACE = '*'
+
+# Первый уровень общий для всех потоков процесса, как у LocMemCache.
+_levels = {}
+_levels_lock = threading.Lock()
+
+
+class _Level:
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+
+class TieredCache(BaseCache):
+    """Небольшой LRU-кеш в памяти процесса перед общим кешем.
+
+    LOCATION - псевдоним кеша второго уровня из CACHES. Каждая запись
+    первого уровня помнит метки версий своего пространства имён (первые
+    NAMESPACE_DEPTH частей ключа через ':') и всего кеша. Метки лежат во
+    втором уровне, запись увеличивает метку, а процесс перечитывает
+    метки один раз за запрос, поэтому устаревшие записи отбрасываются
+    без рассылки сообщений между процессами.
+
+    В IMMUTABLE_NAMESPACES перечисляются пространства имён, значение
+    ключа в которых после записи не меняется: для них метка не
+    проверяется и не увеличивается.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = location
+        self.l1_timeout = options.get('L1_TIMEOUT', 60)
+        self.namespace_depth = options.get('NAMESPACE_DEPTH', 2)
+        self.immutable = frozenset(options.get('IMMUTABLE_NAMESPACES', ()))
+        with _levels_lock:
+            self.level = _levels.setdefault(location, _Level())
+        self._stamps = {}
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def stats(self):
+        with self.level.lock:
+            return dict(self.level.stats, l1_entries=len(self.level.entries))
+
+    def namespace(self, key):
+        return ':'.join(key.split(':')[:self.namespace_depth])
+
+    def _load_stamps(self, namespaces):
+        missing = [ns for ns in namespaces if ns not in self._stamps]
+        if not missing:
+            return
+        keys = {STAMP_KEY.format(ns): ns for ns in missing}
+        found = self.l2.get_many(list(keys))
+        for key, namespace in keys.items():
+            if key not in found:
+                self.l2.add(key, time.time_ns(), None)
+                found[key] = self.l2.get(key, 0)
+            self._stamps[namespace] = found[key]
+
+    def _stamp(self, key):
+        namespace = self.namespace(key)
+        if namespace in self.immutable:
+            return self._stamps[GLOBAL_NAMESPACE], 0
+        return self._stamps[GLOBAL_NAMESPACE], self._stamps[namespace]
+
+    def _prepare(self, keys):
+        namespaces = {GLOBAL_NAMESPACE}
+        namespaces.update(
+            self.namespace(key) for key in keys
+            if self.namespace(key) not in self.immutable
+        )
+        self._load_stamps(namespaces)
+
+    def _bump(self, key):
+        namespace = self.namespace(key)
+        if namespace in self.immutable:
+            return
+        stamp_key = STAMP_KEY.format(namespace)
+        try:
+            self._stamps[namespace] = self.l2.incr(stamp_key)
+        except ValueError:
+            # Метка вытеснена из второго уровня: заводим новую.
+            self._stamps.pop(namespace, None)
+            self._load_stamps([namespace])
+
+    def _remember(self, key, version, value, timeout=DEFAULT_TIMEOUT):
+        expires = time.monotonic() + self.l1_timeout
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is not None:
+            expires = min(expires, time.monotonic() + timeout - time.time())
+        entry = (
+            expires, self._stamp(key),
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+        )
+        level = self.level
+        with level.lock:
+            level.entries[self.make_key(key, version)] = entry
+            level.entries.move_to_end(self.make_key(key, version))
+            while len(level.entries) > self._max_entries:
+                level.entries.popitem(last=False)
+
+    def _forget(self, key, version):
+        with self.level.lock:
+            self.level.entries.pop(self.make_key(key, version), None)
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        self._prepare(keys)
+        found = {}
+        now = time.monotonic()
+        level = self.level
+        with level.lock:
+            for key in keys:
+                entry = level.entries.get(self.make_key(key, version))
+                if entry is None:
+                    continue
+                expires, stamp, value = entry
+                if expires > now and stamp == self._stamp(key):
+                    level.entries.move_to_end(self.make_key(key, version))
+                    found[key] = value
+            level.stats['l1_hits'] += len(found)
+            level.stats['l1_misses'] += len(keys) - len(found)
+        found = {key: pickle.loads(value) for key, value in found.items()}
+        missing = [key for key in keys if key not in found]
+        if missing:
+            fetched = self.l2.get_many(missing, version=version)
+            with level.lock:
+                level.stats['l2_hits'] += len(fetched)
+                level.stats['l2_misses'] += len(missing) - len(fetched)
+            for key, value in fetched.items():
+                self._remember(key, version, value)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._prepare([key])
+        self.l2.set(key, value, timeout, version=version)
+        self._bump(key)
+        self._remember(key, version, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        for key, value in data.items():
+            self.set(key, value, timeout, version)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._prepare([key])
+        added = self.l2.add(key, value, timeout, version=version)
+        if added:
+            self._bump(key)
+            self._remember(key, version, value, timeout)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        self._prepare([key])
+        try:
+            value = self.l2.incr(key, delta, version=version)
+        except ValueError:
+            self._forget(key, version)
+            raise
+        self._bump(key)
+        self._remember(key, version, value)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._forget(key, version)
+        return self.l2.touch(key, timeout, version=version)
+
+    def has_key(self, key, version=None):
+        return self.l2.has_key(key, version=version)
+
+    def delete(self, key, version=None):
+        self._prepare([key])
+        self.l2.delete(key, version=version)
+        self._bump(key)
+        self._forget(key, version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.delete(key, version)
+
+    def clear(self):
+        self.l2.clear()
+        self._stamps.clear()
+        with self.level.lock:
+            self.level.entries.clear()
+
+    def close(self, **kwargs):
+        # Вызывается в конце каждого запроса: метки перечитываются заново.
+        self._stamps.clear()
+        self.l2.close(**kwargs)
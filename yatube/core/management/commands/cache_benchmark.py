@@ -0,0 +1,54 @@
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache.sqlite import SQLiteCache
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость бэкендов кеша: LocMem, файлы и SQLite.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=5000)
+        parser.add_argument('--size', type=int, default=2048)
+
+    def handle(self, *args, **options):
+        operations = options['operations']
+        value = 'x' * options['size']
+        params = {'OPTIONS': {'MAX_ENTRIES': operations * 2}}
+        with tempfile.TemporaryDirectory() as directory:
+            backends = (
+                ('locmem', LocMemCache('benchmark', params)),
+                ('filebased', FileBasedCache(
+                    os.path.join(directory, 'files'), params
+                )),
+                ('sqlite', SQLiteCache(
+                    os.path.join(directory, 'cache.sqlite3'), params
+                )),
+            )
+            self.stdout.write(
+                f'{"backend":<10}{"set/s":>12}{"get/s":>12}{"incr/s":>12}'
+            )
+            for name, cache in backends:
+                keys = [f'benchmark:{number}' for number in range(operations)]
+                rates = [
+                    self.measure(lambda key: cache.set(key, value), keys),
+                    self.measure(cache.get, keys),
+                ]
+                cache.set('benchmark:counter', 0, None)
+                rates.append(self.measure(
+                    lambda key: cache.incr('benchmark:counter'), keys
+                ))
+                self.stdout.write(
+                    f'{name:<10}' + ''.join(f'{rate:>12.0f}' for rate in rates)
+                )
+
+    def measure(self, operation, keys):
+        start = time.perf_counter()
+        for key in keys:
+            operation(key)
+        return len(keys) / (time.perf_counter() - start)
@@ -0,0 +1,143 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def immutable(name):
+    """Имя содержит хеш содержимого, и файл по нему не меняется."""
+    return re.search(settings.MEDIA_IMMUTABLE_PATTERN, name) is not None
+
+
+def byte_range(request, size, etag, last_modified):
+    """Границы запрошенного диапазона байтов или None для всего файла.
+
+    Поддерживается один диапазон: на несколько сразу, как и на
+    устаревший If-Range, отдаётся файл целиком.
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range not in (etag, last_modified):
+        return None
+    match = RANGE_RE.match(header.strip())
+    if match is None or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # bytes=-N: последние N байт.
+        suffix = int(end)
+        if suffix == 0:
+            raise RangeNotSatisfiable
+        start, end = max(0, size - suffix), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def read_range(file, length):
+    with file:
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def accel_response(path, content_type):
+    """Ответ, отдачу файла в котором выполняет веб-сервер перед Django."""
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_ACCEL == 'x-sendfile':
+        response['X-Sendfile'] = path
+    else:
+        relative = os.path.relpath(path, settings.MEDIA_ROOT)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(
+            relative.replace(os.sep, '/')
+        )
+    return response
+
+
+def file_response(request, path, size, content_type, validators):
+    if settings.MEDIA_ACCEL:
+        return accel_response(path, content_type)
+    try:
+        bounds = byte_range(request, size, *validators)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    file = open(path, 'rb')
+    if bounds is None:
+        # Сервер WSGI отдаёт файл через wsgi.file_wrapper (sendfile).
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = bounds
+        file.seek(start)
+        response = StreamingHttpResponse(
+            read_range(file, end - start + 1),
+            status=206, content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve_file(request, path, content_type=None, is_immutable=False):
+    """Отдаёт файл с диска с проверкой условных заголовков и Range.
+
+    ETag и Last-Modified считаются по stat() без чтения файла, поэтому
+    повторный запрос с If-None-Match или If-Modified-Since стоит одного
+    системного вызова и получает 304. Файлы с неизменяемыми именами
+    кешируются браузером на MEDIA_IMMUTABLE_MAX_AGE секунд.
+    """
+    try:
+        stats = os.stat(path)
+    except OSError:
+        raise Http404
+    if not stat.S_ISREG(stats.st_mode):
+        raise Http404
+    etag = quote_etag(f'{stats.st_mtime_ns:x}-{stats.st_size:x}')
+    last_modified = http_date(stats.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stats.st_mtime)
+    )
+    if response is None:
+        content_type = (
+            content_type or mimetypes.guess_type(path)[0]
+            or 'application/octet-stream'
+        )
+        response = file_response(
+            request, path, stats.st_size, content_type,
+            (etag, last_modified),
+        )
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    if is_immutable:
+        cache_control = (
+            f'public, max-age={settings.MEDIA_IMMUTABLE_MAX_AGE}, immutable'
+        )
+    else:
+        cache_control = f'public, max-age={settings.MEDIA_MAX_AGE}'
+    response['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла - хеш SHA-256 его содержимого.
+
+    Файл из upload_to 'posts/' сохраняется как posts/ab/cd/abcd....jpg:
+    первые символы хеша задают вложенные каталоги (depth уровней по
+    width символов), так что в одном каталоге не скапливаются миллионы
+    файлов. Одинаковые файлы записываются один раз, а имя файла с
+    данным содержимым никогда не меняется.
+    """
+
+    def __init__(self, *args, depth=2, width=2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.depth = depth
+        self.width = width
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        shards = [
+            digest[level * self.width:(level + 1) * self.width]
+            for level in range(self.depth)
+        ]
+        return posixpath.join(directory, *shards, digest + extension)
+
+    def get_available_name(self, name, max_length=None):
+        # Совпадение имён означает совпадение содержимого.
+        return name
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        full_path = self.path(name)
+        try:
+            # Файл уже есть: свежее время изменения говорит сборке мусора,
+            # что его только что снова загрузили и пост ещё сохраняется.
+            os.utime(full_path)
+            return name
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(full_path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0)
+            try:
+                os.makedirs(
+                    directory, self.directory_permissions_mode, exist_ok=True
+                )
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        # Файл пишется во временный и переименовывается атомарно: читатели
+        # не увидят недописанный файл, а одновременная загрузка того же
+        # содержимого просто заменит его таким же.
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    temp.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
@@ -0,0 +1,63 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+# Кеши, которые хранят данные в файле LOCATION.
+FILE_CACHE_BACKENDS = ('core.cache.sqlite.SQLiteCache',)
+
+
+@contextmanager
+def isolated_caches():
+    """Файлы кешей на время тестов переносятся во временный каталог.
+
+    Кеш сервера разработки тесты не читают и не стирают.
+    """
+    directory = tempfile.mkdtemp(prefix='yatube-cache-')
+    test_caches = copy.deepcopy(settings.CACHES)
+    for params in test_caches.values():
+        if params['BACKEND'] in FILE_CACHE_BACKENDS:
+            params['LOCATION'] = os.path.join(
+                directory, os.path.basename(params['LOCATION'])
+            )
+    try:
+        with override_settings(CACHES=test_caches):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class ClearCachesResult:
+    """Очищает все кеши перед каждым тестом.
+
+    База между тестами откатывается, и id объектов повторяются, поэтому
+    страницы и счётчики поколений из прошлого теста выдали бы чужие данные.
+    """
+
+    def startTest(self, test):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        super().startTest(test)
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cleanup = ExitStack()
+        self.cleanup.enter_context(isolated_caches())
+
+    def teardown_test_environment(self, **kwargs):
+        self.cleanup.close()
+        super().teardown_test_environment(**kwargs)
+
+    def get_resultclass(self):
+        base = super().get_resultclass() or unittest.TextTestResult
+        return type('Result', (ClearCachesResult, base), {})
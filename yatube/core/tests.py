@@ -1,5 +1,14 @@
+import os
+import shutil
+import tempfile
+
 from django.conf import settings
-from django.test import TestCase
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core.cache.sqlite import SQLiteCache
+from core.cache.tiered import _Level
 
 
 class CastomTeamplateTests(TestCase):
@@ -9,3 +18,201 @@ class CastomTeamplateTests(TestCase):
         settings.DEBUG = False
         response = self.client.get('/unexisting_page/')
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_set_get_delete(self):
+        """Значения сохраняются, читаются и удаляются."""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertEqual(self.cache.get_many(['key', 'missing']), {
+            'key': {'value': 1}
+        })
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_add_incr_and_expiry(self):
+        """add не перезаписывает значение, incr атомарно его меняет."""
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 10))
+        self.assertEqual(self.cache.incr('counter', 5), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('expired', 1, timeout=0)
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertTrue(self.cache.add('expired', 2))
+
+    def test_shared_between_instances(self):
+        """Записи видны другим экземплярам с тем же файлом."""
+        other = SQLiteCache(self.location, {})
+        self.cache.set('key', 'value')
+        self.assertEqual(other.get('key'), 'value')
+        other.set('counter', 1)
+        self.cache.incr('counter')
+        self.assertEqual(other.get('counter'), 2)
+
+    def test_cull_least_recently_used(self):
+        """При переполнении удаляются давно не читавшиеся записи."""
+        cache = SQLiteCache(self.location, {'OPTIONS': {
+            'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 0
+        }})
+        cache.cull_check = 1
+        cache.touch_granularity = -1
+        cache.set('first', 1)
+        for number in range(10):
+            cache.set(f'key:{number}', number)
+            cache.get('first')
+        self.assertEqual(cache.get('first'), 1)
+        self.assertIsNone(cache.get('key:0'))
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'core.cache.tiered.TieredCache',
+        'LOCATION': 'l2',
+        'OPTIONS': {'IMMUTABLE_NAMESPACES': ['fixed:ns']},
+    },
+    'l2': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tiered-tests',
+    },
+})
+class TieredCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+        # Второй экземпляр со своим первым уровнем - как другой процесс.
+        self.other = type(self.cache)('l2', {})
+        self.other.level = _Level()
+
+    def test_l1_serves_repeated_reads(self):
+        """Повторное чтение обслуживается первым уровнем."""
+        self.cache.set('posts:item:1', 'value')
+        self.cache.close()
+        self.assertEqual(self.cache.get('posts:item:1'), 'value')
+        self.assertEqual(self.cache.get('posts:item:1'), 'value')
+        stats = self.cache.stats()
+        self.assertGreaterEqual(stats['l1_hits'], 2)
+
+    def test_other_process_write_invalidates_l1(self):
+        """Запись в другом процессе видна после смены метки версии."""
+        self.cache.set('posts:item:1', 'old')
+        self.assertEqual(self.other.get('posts:item:1'), 'old')
+        self.cache.set('posts:item:1', 'new')
+        self.other.close()
+        self.assertEqual(self.other.get('posts:item:1'), 'new')
+        self.cache.set('posts:counter:1', 1)
+        self.other.close()
+        self.assertEqual(self.other.get('posts:counter:1'), 1)
+        self.cache.incr('posts:counter:1')
+        self.other.close()
+        self.assertEqual(self.other.get('posts:counter:1'), 2)
+
+    def test_clear_invalidates_everything(self):
+        """Очистка кеша сбрасывает и неизменяемые пространства имён."""
+        self.cache.set('fixed:ns:1', 'value')
+        self.assertEqual(self.other.get('fixed:ns:1'), 'value')
+        self.cache.clear()
+        self.other.close()
+        self.assertIsNone(self.other.get('fixed:ns:1'))
+
+
+class MediaViewTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.media_root = override_settings(MEDIA_ROOT=self.directory)
+        self.media_root.enable()
+        self.hashed = 'posts/ab/cd/' + 'abcd' * 16 + '.txt'
+        for name in (self.hashed, 'plain.txt'):
+            path = os.path.join(self.directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(b'0123456789')
+
+    def tearDown(self):
+        self.media_root.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get(self, name, **headers):
+        return self.client.get(reverse('media', args=(name,)), **headers)
+
+    def test_file_served_with_validators(self):
+        """Файл отдаётся целиком с ETag, Last-Modified и сроком кеша."""
+        response = self.get(self.hashed)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertNotIn('immutable', self.get('plain.txt')['Cache-Control'])
+
+    def test_conditional_requests(self):
+        """Повторный запрос с валидаторами получает 304."""
+        response = self.get('plain.txt')
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': response['ETag']},
+            {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']},
+        ):
+            with self.subTest(headers=headers):
+                response = self.get('plain.txt', **headers)
+                self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        """Диапазоны байтов отдаются с кодом 206, неверные - с 416."""
+        etag = self.get('plain.txt')['ETag']
+        for header, content in (
+            ('bytes=2-4', b'234'),
+            ('bytes=7-', b'789'),
+            ('bytes=-2', b'89'),
+        ):
+            with self.subTest(header=header):
+                response = self.get('plain.txt', HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(
+                    b''.join(response.streaming_content), content
+                )
+        response = self.get('plain.txt', HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        response = self.get('plain.txt', HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        response = self.get(
+            'plain.txt', HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"old"'
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.get(
+            'plain.txt', HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE=etag
+        )
+        self.assertEqual(response.status_code, 206)
+
+    def test_accel_modes(self):
+        """Отдачу файла можно передать nginx или Apache."""
+        with self.settings(MEDIA_ACCEL='x-accel-redirect'):
+            response = self.get(self.hashed)
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/' + self.hashed
+        )
+        self.assertEqual(response.content, b'')
+        with self.settings(MEDIA_ACCEL='x-sendfile'):
+            response = self.get('plain.txt')
+        self.assertEqual(
+            response['X-Sendfile'],
+            os.path.join(self.directory, 'plain.txt'),
+        )
+
+    def test_missing_and_outside_files(self):
+        """Отсутствующие файлы и пути вне MEDIA_ROOT дают 404."""
+        for name in ('missing.txt', 'posts', '../settings.py'):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name).status_code, 404)
@@ -1,4 +1,11 @@
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
+
+from .media import immutable, serve_file
 
 
 def page_not_found(request, exception):
@@ -19,3 +26,13 @@ def server_error(request):
     return render(
         request, 'core/500.html', status=500
     )
+
+
+@require_safe
+def media(request, path):
+    """Файл из MEDIA_ROOT: с 304, диапазонами байтов и долгим кешем."""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    return serve_file(request, full_path, is_immutable=immutable(path))
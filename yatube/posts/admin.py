@@ -1,7 +1,10 @@
 from django.contrib import admin
 
+from . import search
 from .models import Comment, Group, Post
 
+SEARCH_LIMIT = 1000
+
 
 class PostAdmin(admin.ModelAdmin):
     list_display = ("id", "text", "pub_date", "author", "group")
@@ -9,6 +12,15 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date", "group")
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по индексу FTS5 вместо LIKE по всей таблице.
+        if not search_term or not search.available():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        post_ids = search.post_ids(search_term, SEARCH_LIMIT)
+        return queryset.filter(id__in=post_ids), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("title", "slug", "description")
@@ -0,0 +1,148 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+
+from .utils import CursorPaginator
+
+# Поля поста в ответе API: столбцы, которые для них выбираются из базы,
+# и связи, которые подтягиваются тем же запросом.
+FIELDS = {
+    'id': ((), ()),
+    'text': (('text',), ()),
+    'pub_date': ((), ()),
+    'author': (
+        ('author__username', 'author__first_name', 'author__last_name'),
+        ('author',),
+    ),
+    'group': (('group__slug', 'group__title'), ('group',)),
+    'image': (('image', 'image_width', 'image_height'), ()),
+    'comments_count': (('comments_count',), ()),
+}
+
+
+class FieldsError(ValueError):
+    pass
+
+
+def parse_fields(value):
+    """Поля из параметра fields=; без него - все."""
+    if not value:
+        return list(FIELDS)
+    fields = list(dict.fromkeys(
+        field.strip() for field in value.split(',') if field.strip()
+    ))
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise FieldsError(
+            'Неизвестные поля: {}. Доступны: {}.'.format(
+                ', '.join(unknown), ', '.join(FIELDS)
+            )
+        )
+    return fields or list(FIELDS)
+
+
+def parse_limit(value):
+    try:
+        limit = int(value or settings.PAGINATOR_PAGE)
+    except ValueError:
+        limit = settings.PAGINATOR_PAGE
+    return max(1, min(limit, settings.API_PAGE_MAX))
+
+
+def select(posts, fields):
+    """Выборка только тех столбцов, что нужны для полей ответа.
+
+    id и pub_date нужны курсору и выбираются всегда.
+    """
+    columns, relations = ['id', 'pub_date'], []
+    for field in fields:
+        field_columns, field_relations = FIELDS[field]
+        columns.extend(field_columns)
+        relations.extend(field_relations)
+    if relations:
+        posts = posts.select_related(*relations)
+    else:
+        # Иначе select_related() из менеджера потянет лишние таблицы.
+        posts = posts.select_related(None)
+    return posts.only(*columns)
+
+
+def serialize(post, fields):
+    data = {}
+    for field in fields:
+        if field == 'author':
+            data[field] = {
+                'username': post.author.username,
+                'name': post.author.get_full_name(),
+            }
+        elif field == 'group':
+            data[field] = {
+                'slug': post.group.slug, 'title': post.group.title,
+            } if post.group else None
+        elif field == 'image':
+            data[field] = {
+                'url': post.image.url,
+                'width': post.image_width,
+                'height': post.image_height,
+            } if post.image else None
+        else:
+            data[field] = getattr(post, field)
+    return data
+
+
+def cursor_url(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return f'{request.path}?{query.urlencode()}'
+
+
+def encode(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def stream(request, page, fields):
+    """Части JSON страницы: посты кодируются по одному.
+
+    Ссылки на соседние страницы идут после списка, так что ответ не
+    собирается целиком в памяти ни в виде словаря, ни в виде строки.
+    """
+    yield '{"results": ['
+    for index, post in enumerate(page):
+        yield (',' if index else '') + encode(serialize(post, fields))
+    paginator = page.paginator
+    yield '], "next": {}, "previous": {}}}'.format(
+        encode(cursor_url(request, paginator.next_cursor)),
+        encode(cursor_url(request, paginator.previous_cursor)),
+    )
+
+
+def error(message, status):
+    return JsonResponse(
+        {'detail': message}, status=status,
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+def listing(request, posts, ordering=('-pub_date', '-id')):
+    """Страница постов в JSON с курсором и выбором полей.
+
+    Параметры: fields - поля через запятую, limit - размер страницы
+    (не больше API_PAGE_MAX), cursor - курсор из ссылки next или
+    previous предыдущего ответа.
+    """
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+    except FieldsError as exc:
+        return error(str(exc), 400)
+    paginator = CursorPaginator(
+        select(posts, fields), parse_limit(request.GET.get('limit')),
+        ordering,
+    )
+    page = paginator.page(request.GET.get('cursor'))
+    return StreamingHttpResponse(
+        stream(request, page, fields), content_type='application/json'
+    )
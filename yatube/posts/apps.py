@@ -1,6 +1,28 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import post_migrate
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
     verbose_name = 'Блог'
+
+    def ready(self):
+        from . import search, signals, thumbnails  # noqa: F401
+        # Миграции не создают виртуальную таблицу FTS5, создаём её сами.
+        post_migrate.connect(search.create_table, sender=self)
+        request_finished.connect(
+            thumbnails.forget_prefetched, dispatch_uid='posts_thumbnails'
+        )
+        if settings.WARM_CACHE_ON_START:
+            # Обращаться к базе из ready() нельзя, поэтому прогрев
+            # запускается при первом запросе к процессу.
+            request_started.connect(
+                self.warm_cache, dispatch_uid='posts_warm_cache'
+            )
+
+    def warm_cache(self, **kwargs):
+        from . import warmup
+        request_started.disconnect(dispatch_uid='posts_warm_cache')
+        warmup.warm_in_background()
@@ -0,0 +1,274 @@
+import hashlib
+import math
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+from . import holes, warmup
+
+GENERATION_KEY = 'posts:generation:{}'
+
+MODIFIED_KEY = 'posts:modified:{}'
+
+
+def generations(namespaces):
+    """Текущие номера поколений пространств имён кеша."""
+    keys = [GENERATION_KEY.format(namespace) for namespace in namespaces]
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        # Счётчик, вытесненный из кеша, начинается с текущего времени,
+        # чтобы не совпасть ни с одним из прежних поколений.
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        values.update(cache.get_many(missing))
+    return [values.get(key, 0) for key in keys]
+
+
+def bump(*namespaces):
+    for namespace in namespaces:
+        key = GENERATION_KEY.format(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+    now = time.time()
+    cache.set_many(
+        {MODIFIED_KEY.format(namespace): now for namespace in namespaces},
+        None,
+    )
+
+
+def modified(namespaces):
+    """Время последнего изменения данных пространств имён кеша.
+
+    Отметка, вытесненная из кеша, считается только что поставленной:
+    лишний полный ответ лучше ответа 304 на изменившуюся страницу.
+    """
+    keys = [MODIFIED_KEY.format(namespace) for namespace in namespaces]
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        now = time.time()
+        for key in missing:
+            cache.add(key, now, None)
+        values.update(cache.get_many(missing))
+    return max(values.values(), default=time.time())
+
+
+def post_namespaces(post_id, username, slug):
+    """Пространства имён страниц, на которых выводится пост."""
+    namespaces = ['index', f'post:{post_id}', f'profile:{username}']
+    if slug:
+        namespaces.append(f'group:{slug}')
+    return namespaces
+
+
+def page_key(request, namespaces):
+    versions = '.'.join(map(str, generations(namespaces)))
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'posts:page:{path}:{versions}'
+
+
+def latest_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'posts:latest:{path}'
+
+
+def card_tags(post_id=None, author_id=None, group_id=None):
+    """Теги карточек поста, его автора и его группы."""
+    tags = []
+    if post_id:
+        tags.append(f'card:post:{post_id}')
+    if author_id:
+        tags.append(f'card:author:{author_id}')
+    if group_id:
+        tags.append(f'card:group:{group_id}')
+    return tags
+
+
+def card_key(post):
+    tags = card_tags(post.id, post.author_id, post.group_id)
+    versions = '.'.join(map(str, generations(tags)))
+    return f'posts:card:{post.id}:{versions}'
+
+
+def invalidate_cards(post_id=None, author_id=None, group_id=None):
+    bump(*card_tags(post_id, author_id, group_id))
+
+
+def is_fresh(entry):
+    _, expires, delta = entry
+    jitter = -delta * settings.CACHE_EARLY_BETA * math.log(1 - random.random())
+    return time.time() + jitter < expires
+
+
+def wait_for(key):
+    deadline = time.time() + settings.CACHE_LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(settings.CACHE_LOCK_POLL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return None
+
+
+def cached(key, compute, timeout, stale_key=None):
+    """Значение из кеша с защитой от одновременного пересчёта.
+
+    Запись пересчитывается немного раньше срока с вероятностью, растущей
+    к его концу (чем дольше считается значение, тем раньше). Пересчитывает
+    только процесс, взявший блокировку, остальные сразу получают прежнее
+    значение - устаревшую запись или последнее значение по stale_key.
+    compute может вернуть None, тогда значение не кешируется.
+    """
+    entry = cache.get(key)
+    stale = None
+    if entry is not None:
+        if is_fresh(entry):
+            return entry[0]
+        stale = entry[0]
+    elif stale_key:
+        stale = cache.get(stale_key)
+    lock_key = f'{key}:lock'
+    locked = cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT)
+    if not locked:
+        if stale is None:
+            stale = wait_for(key)
+        if stale is not None:
+            return stale
+    try:
+        started = time.time()
+        value = compute()
+        delta = time.time() - started
+        if value is not None:
+            lifetime = timeout + settings.CACHE_STALE_TIMEOUT
+            cache.set(key, (value, time.time() + timeout, delta), lifetime)
+            if stale_key:
+                cache.set(stale_key, value, lifetime)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
+
+
+def cache_listing(*namespaces):
+    """Кеширует страницу до изменения связанных с ней данных.
+
+    Пространства имён форматируются аргументами представления, например
+    'group:{slug}'; сигналы моделей увеличивают их поколения. Страница
+    одна для всех посетителей: части, зависящие от пользователя, в ней
+    заменены метками тега {% hole %} и заполняются при каждом запросе.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            warmup.record(request)
+            key = page_key(
+                request,
+                [namespace.format(**kwargs) for namespace in namespaces]
+            )
+            rendered = []
+
+            def render():
+                request.punch_holes = True
+                try:
+                    response = view(request, *args, **kwargs)
+                finally:
+                    request.punch_holes = False
+                rendered.append(response)
+                if response.status_code == 200:
+                    return response.content
+                return None
+
+            content = cached(
+                key, render, settings.LISTING_CACHE_TIMEOUT,
+                stale_key=latest_key(request),
+            )
+            response = rendered[0] if rendered else HttpResponse(content)
+            if response.status_code == 200:
+                response.content = holes.fill(
+                    request, response.content.decode(response.charset)
+                )
+            return response
+        wrapper.cache_namespaces = namespaces
+        return wrapper
+    return decorator
+
+
+def validators(request, namespaces):
+    """ETag и Last-Modified страницы без её отрисовки.
+
+    ETag складывается из пути, поколений пространств имён и посетителя:
+    части страницы в метках {% hole %} зависят от пользователя, а форма
+    комментария - ещё и от cookie CSRF. Last-Modified отдаётся только
+    анонимам: время не меняется при входе на сайт, и по одному
+    If-Modified-Since пользователь получил бы страницу гостя.
+    """
+    versions = '.'.join(map(str, generations(namespaces)))
+    viewer = ''
+    if request.user.is_authenticated:
+        viewer = '{}:{}'.format(
+            request.user.pk,
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        )
+    etag = quote_etag(hashlib.md5(
+        f'{request.get_full_path()}|{versions}|{viewer}'.encode()
+    ).hexdigest())
+    if request.user.is_authenticated:
+        return etag, None
+    return etag, math.ceil(modified(namespaces))
+
+
+def conditional(*namespaces, max_age=0):
+    """Отвечает 304, если страница не менялась с прошлого запроса.
+
+    Над cache_listing к его пространствам имён добавляются namespaces -
+    данные, от которых зависят части страницы в метках {% hole %}.
+    Кроме аргументов представления в namespaces доступен request,
+    например 'feed:{request.user.pk}'. Гостевые страницы браузер и
+    обратный прокси могут хранить max_age секунд, страницы
+    пользователей - только браузер, и перед показом он их проверяет.
+    """
+    def decorator(view):
+        listed = getattr(view, 'cache_namespaces', ()) + namespaces
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            etag, last_modified = validators(
+                request,
+                [
+                    namespace.format(request=request, **kwargs)
+                    for namespace in listed
+                ]
+            )
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                return response
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(
+                    response, public=True, max_age=max_age,
+                    must_revalidate=True,
+                )
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,286 @@
+import heapq
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import F, Q
+
+from . import caching, stats
+from .models import Follow, Post, TimelineEntry, UserStats
+from .utils import NEXT, decode_cursor
+
+FEED_ORDERING = ('-feed_date', '-feed_post')
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+MICROSECOND = timedelta(microseconds=1)
+
+RECENT_NAMESPACE = 'recent:{}'
+
+
+def to_key(date, pk):
+    return (date - EPOCH) // MICROSECOND, pk
+
+
+class RecentPosts:
+    """Кольцевой буфер ключей (pub_date, id) последних постов автора."""
+
+    __slots__ = ('dates', 'ids', 'start', 'size', 'truncated', 'generation')
+
+    def __init__(self, capacity, keys=(), truncated=False, generation=None):
+        self.dates = array('q', [0]) * capacity
+        self.ids = array('q', [0]) * capacity
+        self.start = 0
+        self.size = 0
+        # В базе могут быть посты автора старше самого старого в буфере.
+        self.truncated = truncated
+        # Поколение постов автора в общем кеше, с которым загружен буфер.
+        self.generation = generation
+        for date, pk in keys:
+            self.push(date, pk)
+
+    def push(self, date, pk):
+        capacity = len(self.ids)
+        end = (self.start + self.size) % capacity
+        self.dates[end] = date
+        self.ids[end] = pk
+        if self.size < capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % capacity
+            self.truncated = True
+
+    def __iter__(self):
+        capacity = len(self.ids)
+        for offset in range(self.size - 1, -1, -1):
+            index = (self.start + offset) % capacity
+            yield self.dates[index], self.ids[index]
+
+
+class RecentPostsIndex:
+    """Буферы последних постов по авторам в памяти процесса.
+
+    Буфер автора загружается из базы при первом обращении. Создание и
+    удаление поста в любом процессе увеличивает поколение автора в общем
+    кеше, и буфер с прежним поколением загружается заново.
+    """
+
+    def __init__(self):
+        self.rings = OrderedDict()
+        self.lock = threading.Lock()
+
+    def changed(self, author_id):
+        caching.bump(RECENT_NAMESPACE.format(author_id))
+        with self.lock:
+            self.rings.pop(author_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.rings.clear()
+
+    def load(self, author_id, generation):
+        capacity = settings.FEED_RING_SIZE
+        rows = list(
+            Post.objects.filter(author=author_id)
+            .order_by('-pub_date', '-id')
+            .values_list('pub_date', 'id')[:capacity]
+        )
+        keys = [to_key(date, pk) for date, pk in reversed(rows)]
+        ring = RecentPosts(
+            capacity, keys, len(rows) == capacity, generation
+        )
+        with self.lock:
+            self.rings[author_id] = ring
+            while len(self.rings) > settings.FEED_RING_AUTHORS:
+                self.rings.popitem(last=False)
+        return ring
+
+    def merge(self, author_ids, limit):
+        """Первые limit ключей ленты и признак её полноты."""
+        rings = []
+        versions = caching.generations(
+            [RECENT_NAMESPACE.format(author_id) for author_id in author_ids]
+        )
+        for author_id, generation in zip(author_ids, versions):
+            with self.lock:
+                ring = self.rings.get(author_id)
+                if ring is not None:
+                    self.rings.move_to_end(author_id)
+            if ring is None or ring.generation != generation:
+                ring = self.load(author_id, generation)
+            rings.append(ring)
+        with self.lock:
+            snapshots = [list(ring) for ring in rings]
+            complete = not any(ring.truncated for ring in rings)
+        complete = complete and sum(map(len, snapshots)) <= limit
+        keys = list(islice(heapq.merge(*snapshots, reverse=True), limit))
+        return keys, complete
+
+
+recent_posts = RecentPostsIndex()
+
+
+def popular_author_ids(author_ids):
+    """Авторы, посты которых не раскладываются по лентам подписчиков."""
+    return set(
+        UserStats.objects.filter(
+            user__in=author_ids,
+            followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+        ).values_list('user_id', flat=True)
+    )
+
+
+def fan_out_post(post):
+    if popular_author_ids([post.author_id]):
+        return
+    follower_ids = (
+        Follow.objects.filter(author=post.author_id)
+        .values_list('user_id', flat=True)
+        .iterator(chunk_size=settings.TIMELINE_FANOUT_BATCH)
+    )
+    batch = []
+    for user_id in follower_ids:
+        batch.append(TimelineEntry(
+            user_id=user_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        ))
+        if len(batch) >= settings.TIMELINE_FANOUT_BATCH:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill_timeline(user_id, author_id):
+    """Раскладывает в ленту нового подписчика все посты автора.
+
+    Посты читаются и записываются пачками по TIMELINE_FANOUT_BATCH, так
+    что лента совпадает с выборкой по подпискам при любом числе постов.
+    """
+    if popular_author_ids([author_id]):
+        return
+    _backfill(user_id, author_id)
+
+
+def _backfill(user_id, author_id):
+    posts = (
+        Post.objects.filter(author=author_id)
+        .values_list('id', 'pub_date')
+        .iterator(chunk_size=settings.TIMELINE_FANOUT_BATCH)
+    )
+    batch = []
+    for post_id, pub_date in posts:
+        batch.append(TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        ))
+        if len(batch) >= settings.TIMELINE_FANOUT_BATCH:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def drop_follower(author_id):
+    """Уменьшает число подписчиков автора на одного.
+
+    Пока подписчиков больше TIMELINE_FANOUT_LIMIT, посты автора не
+    раскладываются по лентам, а читаются напрямую. Когда подписчиков
+    остаётся столько, сколько лимит, прямое чтение прекращается, и все
+    посты автора раскладываются по лентам его подписчиков.
+    """
+    crossed = UserStats.objects.filter(
+        user=author_id,
+        followers_count=settings.TIMELINE_FANOUT_LIMIT + 1,
+    ).update(followers_count=F('followers_count') - 1)
+    if not crossed:
+        stats.bump(author_id, followers_count=-1)
+        return
+    follower_ids = (
+        Follow.objects.filter(author=author_id)
+        .values_list('user_id', flat=True)
+        .iterator(chunk_size=settings.TIMELINE_FANOUT_BATCH)
+    )
+    for user_id in follower_ids:
+        _backfill(user_id, author_id)
+
+
+def prune_timeline(user_id, author_id):
+    TimelineEntry.objects.filter(user=user_id, author=author_id).delete()
+
+
+def sql_feed(user, cursor=None):
+    return Post.objects.filter(
+        author__following__user=user
+    ).annotate(feed_date=F('pub_date'), feed_post=F('id'))
+
+
+def materialized_feed(user, cursor=None):
+    popular = popular_author_ids(
+        Follow.objects.filter(user=user).values('author')
+    )
+    if not popular:
+        # Один проход по индексу timeline_user_date_idx.
+        return Post.objects.filter(
+            timeline_entries__user=user
+        ).annotate(
+            feed_date=F('timeline_entries__pub_date'),
+            feed_post=F('timeline_entries__post_id'),
+        )
+    # Посты популярных авторов забираются из таблицы постов напрямую.
+    return Post.objects.filter(
+        Q(id__in=TimelineEntry.objects.filter(
+            user=user).values('post_id'))
+        | Q(author__in=popular)
+    ).annotate(feed_date=F('pub_date'), feed_post=F('id'))
+
+
+def merge_feed(user, cursor=None):
+    direction, position = decode_cursor(cursor)
+    author_ids = list(
+        Follow.objects.filter(user=user).values_list('author_id', flat=True)
+    )
+    keys, complete = recent_posts.merge(author_ids, settings.FEED_RING_SIZE)
+    size = settings.PAGINATOR_PAGE + 1
+    if position is None:
+        window = keys[:size]
+    else:
+        position = to_key(*position)
+        if not complete and (not keys or position < keys[-1]):
+            return sql_feed(user)
+        if direction == NEXT:
+            window = [key for key in keys if key < position][:size]
+        else:
+            window = [key for key in keys if key > position][-size:]
+    if direction == NEXT and len(window) < size and not complete:
+        # Страница выходит за пределы буферов.
+        return sql_feed(user)
+    return Post.objects.filter(
+        id__in=[pk for _, pk in window]
+    ).annotate(feed_date=F('pub_date'), feed_post=F('id'))
+
+
+FEED_STRATEGIES = {
+    'sql': sql_feed,
+    'materialized': materialized_feed,
+    'merge': merge_feed,
+}
+
+
+def follow_feed(request, per_page=None):
+    strategy = settings.FOLLOW_FEED_STRATEGY
+    if strategy == 'merge' and (
+        'page' in request.GET or not settings.PAGINATOR_CURSOR
+        or per_page not in (None, settings.PAGINATOR_PAGE)
+    ):
+        # Буферы не умеют отдавать нумерованные страницы и окна
+        # другого размера.
+        strategy = 'sql'
+    return FEED_STRATEGIES[strategy](
+        request.user, request.GET.get('cursor')
+    )
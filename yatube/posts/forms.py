@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from . import images
 from .models import Comment, Post
 
 
@@ -9,6 +11,21 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Время этапов обработки загруженной картинки.
+        self.image_timings = {}
+
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        try:
+            image, self.image_timings = images.normalize_upload(image)
+        except (OSError, ValueError):
+            raise forms.ValidationError('Не удалось обработать картинку.')
+        return image
+
 
 class CommentForm(forms.ModelForm):
 
@@ -0,0 +1,92 @@
+import re
+
+from django.template.loader import render_to_string
+
+from . import stats
+from .forms import CommentForm
+from .models import Follow
+
+HOLE_RE = re.compile(r'<!--hole:([\w:@.+-]*)-->')
+
+HOLES = {}
+
+
+def hole(function):
+    """Регистрирует часть страницы, которая зависит от пользователя.
+
+    В общей для всех закешированной странице на её месте остаётся метка,
+    которая заполняется заново при каждом запросе. Аргументы приходят
+    строками.
+    """
+    HOLES[function.__name__] = function
+    return function
+
+
+def marker(name, args):
+    return '<!--hole:{}-->'.format(':'.join((name, *args)))
+
+
+def render(request, name, args):
+    return HOLES[name](request, *args)
+
+
+def fill(request, content):
+    return HOLE_RE.sub(
+        lambda match: render(request, *_parse(match.group(1))), content
+    )
+
+
+def _parse(value):
+    name, *args = value.split(':')
+    return name, args
+
+
+@hole
+def header(request):
+    return render_to_string('includes/header_user.html', request=request)
+
+
+@hole
+def switcher(request):
+    return render_to_string('includes/switcher.html', request=request)
+
+
+@hole
+def follow_button(request, username):
+    user = request.user
+    if user.username == username:
+        return ''
+    following = user.is_authenticated and Follow.objects.filter(
+        user=user, author__username=username
+    ).exists()
+    return render_to_string(
+        'includes/follow_button.html',
+        {'username': username, 'following': following},
+        request=request,
+    )
+
+
+@hole
+def edit_button(request, post_id, author_id):
+    if str(request.user.pk) != author_id:
+        return ''
+    return render_to_string(
+        'includes/edit_button.html', {'post_id': post_id}, request=request
+    )
+
+
+@hole
+def author_posts_count(request, author_id):
+    author_stats = stats.get(int(author_id))
+    return str(author_stats.posts_count if author_stats else 0)
+
+
+@hole
+def comment_form(request, post_id):
+    if not request.user.is_authenticated:
+        return ''
+    return render_to_string(
+        'includes/comment_form.html',
+        {'post_id': post_id, 'form': CommentForm()},
+        request=request,
+    )
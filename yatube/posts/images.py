@@ -0,0 +1,148 @@
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {
+    'AVIF': '.avif',
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'WEBP': '.webp',
+}
+
+_executor = None
+_lock = threading.Lock()
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+
+
+def normalize(data, max_size, image_format, alpha_format, quality):
+    """Приводит картинку к виду для хранения.
+
+    Поворачивает по EXIF, уменьшает до max_size по большей стороне и
+    перекодирует без метаданных: в прогрессивный JPEG (image_format) или,
+    если есть прозрачность, в alpha_format. Анимированные картинки не
+    трогает. Возвращает содержимое, расширение и время этапов в секундах;
+    выполняется в процессе пула, поэтому не обращается к настройкам.
+    """
+    timings = {}
+    started = time.perf_counter()
+
+    def lap(stage):
+        nonlocal started
+        now = time.perf_counter()
+        timings[stage] = now - started
+        started = now
+
+    image = Image.open(io.BytesIO(data))
+    if getattr(image, 'is_animated', False):
+        return None, None, timings
+    # JPEG сразу декодируется в уменьшенном масштабе.
+    image.draft('RGB', (max_size, max_size))
+    image.load()
+    lap('decode')
+    image = ImageOps.exif_transpose(image)
+    lap('orient')
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    lap('resize')
+    if has_alpha(image):
+        image_format = alpha_format
+        image = image.convert('RGBA')
+    else:
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    options = {'quality': quality}
+    if image_format == 'JPEG':
+        options.update(progressive=True, optimize=True)
+    image.save(output, image_format, **options)
+    lap('encode')
+    return output.getvalue(), EXTENSIONS[image_format], timings
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS
+            )
+        return _executor
+
+
+def discard_executor(broken):
+    """Забывает сломанный пул: следующая картинка запустит новый."""
+    global _executor
+    with _lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+def normalize_in_pool(arguments):
+    pool = executor()
+    try:
+        return pool.submit(normalize, *arguments).result()
+    except BrokenProcessPool:
+        # Процесс пула упал (например, его убил OOM killer): картинка
+        # обрабатывается здесь же, а пул создаётся заново.
+        logger.warning('Пул обработки картинок сломан, запускается новый')
+        discard_executor(pool)
+        return normalize(*arguments)
+
+
+def normalize_upload(upload):
+    """Нормализованная копия загруженного файла и время этапов.
+
+    Декодирование и кодирование выполняются в пуле процессов, чтобы не
+    занимать GIL процесса, обслуживающего запросы. Если картинку
+    нормализовать не нужно, возвращает сам файл.
+    """
+    started = time.perf_counter()
+    upload.seek(0)
+    data = upload.read()
+    timings = {'read': time.perf_counter() - started}
+    arguments = (
+        data,
+        settings.IMAGE_MAX_SIZE,
+        settings.IMAGE_FORMAT,
+        'WEBP' if features.check('webp') else 'PNG',
+        settings.IMAGE_QUALITY,
+    )
+    if settings.IMAGE_WORKERS:
+        started = time.perf_counter()
+        content, extension, stages = normalize_in_pool(arguments)
+        stages['pool'] = time.perf_counter() - started - sum(stages.values())
+    else:
+        content, extension, stages = normalize(*arguments)
+    timings.update(stages)
+    logger.info(
+        'Картинка %s: %s', upload.name,
+        ', '.join(f'{stage} {value * 1000:.1f} мс'
+                  for stage, value in timings.items())
+    )
+    if content is None:
+        upload.seek(0)
+        return upload, timings
+    name = os.path.splitext(os.path.basename(upload.name))[0] + extension
+    return ContentFile(content, name=name), timings
+
+
+def server_timing(timings):
+    """Значение заголовка Server-Timing для времени этапов."""
+    return ', '.join(
+        f'image-{stage};dur={value * 1000:.1f}'
+        for stage, value in timings.items()
+    )
@@ -0,0 +1,58 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import media
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет оригиналы картинок, их варианты и миниатюры, на которые '
+        'не ссылается ни один пост. Прерванная сборка продолжается с '
+        'сохранённого места.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только вывести, что будет удалено.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--min-age', type=int, default=settings.MEDIA_GC_MIN_AGE,
+            help='Не трогать файлы моложе стольких секунд.'
+        )
+        parser.add_argument(
+            '--checkpoint', default=settings.MEDIA_GC_CHECKPOINT,
+            help='Файл с местом, где остановилась сборка.'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать сначала, не глядя на сохранённое место.'
+        )
+
+    def handle(self, *args, **options):
+        # Пробный запуск не сдвигает место, с которого продолжится сборка.
+        path = None if options['dry_run'] else options['checkpoint']
+        if options['restart'] and path:
+            media.Checkpoint(path).clear()
+        checkpoint = media.Checkpoint(path)
+        found = Counter()
+
+        def report(kind, name):
+            found[kind] += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{kind}: {name}')
+
+        media.collect_garbage(
+            checkpoint, options['batch_size'], options['min_age'],
+            options['dry_run'], report,
+        )
+        if not found:
+            self.stdout.write('Ненужных файлов нет.')
+            return
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(f'{action}: ' + ', '.join(
+            f'{kind} {count}' for kind, count in sorted(found.items())
+        ))
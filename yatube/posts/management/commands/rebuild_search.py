@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заново строит полнотекстовый индекс постов пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        search.create_table()
+        search.clear()
+        last_id = 0
+        total = 0
+        while True:
+            rows = list(
+                Post.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'text')[:batch_size]
+            )
+            if not rows:
+                break
+            with transaction.atomic():
+                search.index_posts(rows)
+            last_id = rows[-1][0]
+            total += len(rows)
+        self.stdout.write(f'Проиндексировано {total} постов.')
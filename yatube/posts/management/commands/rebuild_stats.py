@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts import stats
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает статистику пользователей пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not user_ids:
+                break
+            stats.rebuild(user_ids)
+            last_id = user_ids[-1]
+            total += len(user_ids)
+        self.stdout.write(f'Пересчитана статистика {total} пользователей.')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts import feeds
+from posts.models import Follow
+
+
+class Command(BaseCommand):
+    help = 'Заполняет ленты подписок по существующим подпискам пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        while True:
+            follows = list(
+                Follow.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'user_id', 'author_id')[:batch_size]
+            )
+            if not follows:
+                break
+            for _, user_id, author_id in follows:
+                feeds.backfill_timeline(user_id, author_id)
+            last_id = follows[-1][0]
+            total += len(follows)
+        self.stdout.write(f'Заполнены ленты по {total} подпискам.')
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает число комментариев у постов пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        fixed = 0
+        while True:
+            posts = list(
+                Post.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', 'comments_count')[:batch_size]
+            )
+            if not posts:
+                break
+            with transaction.atomic():
+                counts = dict(
+                    Comment.objects.filter(post__in=posts)
+                    .order_by()
+                    .values_list('post')
+                    .annotate(Count('id'))
+                )
+                changed = []
+                for post in posts:
+                    count = counts.get(post.id, 0)
+                    if post.comments_count != count:
+                        post.comments_count = count
+                        changed.append(post)
+                Post.objects.bulk_update(changed, ('comments_count',))
+            fixed += len(changed)
+            last_id = posts[-1].id
+        self.stdout.write(f'Исправлено счётчиков комментариев: {fixed}.')
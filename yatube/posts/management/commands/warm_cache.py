@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import warmup
+
+
+class Command(BaseCommand):
+    help = (
+        'Рендерит и кеширует первые страницы главной, популярных групп '
+        'и профилей вместе с миниатюрами картинок.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Пути страниц списков.')
+        parser.add_argument('--pages', type=int)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        warmed = warmup.warm(options['paths'] or None, options['pages'])
+        for path, pages in warmed.items():
+            self.stdout.write(f'{path}: {pages}')
+        self.stdout.write(
+            f'Прогрето страниц: {sum(warmed.values())} '
+            f'за {time.monotonic() - started:.1f} с.'
+        )
@@ -0,0 +1,283 @@
+import itertools
+import json
+import logging
+import os
+import posixpath
+import time
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from sorl.thumbnail import default, delete
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import images, variants
+from .models import Post, StoredFile
+
+logger = logging.getLogger(__name__)
+
+# Расширения оригиналов: нормализованных и оставленных как есть.
+SOURCE_EXTENSIONS = sorted(
+    set(images.EXTENSIONS.values()) | {'.jpeg', '.gif'}
+)
+
+
+def storage():
+    return Post._meta.get_field('image').storage
+
+
+def acquire(name):
+    """Добавляет ссылку на файл картинки."""
+    stored, created = StoredFile.objects.get_or_create(
+        name=name, defaults={'refs': 1}
+    )
+    if not created:
+        StoredFile.objects.filter(name=name).update(refs=F('refs') + 1)
+
+
+def release(name):
+    """Убирает ссылку на файл; последняя удаляет файл после коммита."""
+    StoredFile.objects.filter(name=name).update(refs=F('refs') - 1)
+    deleted, _ = StoredFile.objects.filter(name=name, refs__lte=0).delete()
+    if deleted:
+        transaction.on_commit(
+            lambda: remove(name, settings.MEDIA_REUSE_GRACE)
+        )
+
+
+def saved_since(name, age):
+    """Файл записан или загружен снова не раньше age секунд назад."""
+    try:
+        modified = os.path.getmtime(storage().path(name))
+    except (OSError, SuspiciousFileOperation):
+        return False
+    return modified > time.time() - age
+
+
+def in_use(name):
+    return (
+        StoredFile.objects.select_for_update().filter(name=name).exists()
+        or Post.objects.filter(image=name).exists()
+    )
+
+
+def remove(name, min_age=0):
+    """Удаляет файл, его варианты, миниатюры и записи о них в sorl.
+
+    Файл остаётся, если на него снова ссылаются или его загрузили снова
+    не раньше min_age секунд назад: пост с ним может быть ещё не
+    сохранён, а ненужный файл потом удалит gc_media.
+    """
+    with transaction.atomic():
+        if in_use(name) or saved_since(name, min_age):
+            return
+        try:
+            delete(ImageFile(name, storage()))
+            variants.delete(name)
+        except Exception:
+            logger.exception('Не удалось удалить файл %s', name)
+
+
+def walk(root, top=(), position=()):
+    """Файлы каталога root/top по порядку имён, идущие после position.
+
+    Пути - кортежи частей: в этом порядке и идёт обход, поэтому его можно
+    продолжить с любого места, пропустив пройденные каталоги целиком.
+    В памяти держится только список одного каталога на каждом уровне.
+    """
+    try:
+        entries = sorted(
+            os.scandir(os.path.join(root, *top)), key=lambda e: e.name
+        )
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        parts = top + (entry.name,)
+        if entry.is_dir(follow_symlinks=False):
+            if parts >= position[:len(parts)]:
+                yield from walk(root, parts, position)
+        elif entry.is_file(follow_symlinks=False) and parts > position:
+            yield parts, entry
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def live_images(names):
+    return set(
+        Post.objects.filter(image__in=names).values_list('image', flat=True)
+    )
+
+
+def variant_sources(name):
+    """Возможные имена картинки, которой принадлежит файл варианта."""
+    stem = posixpath.dirname(name)[len(variants.PREFIX) + 1:]
+    return [stem + extension for extension in SOURCE_EXTENSIONS]
+
+
+def orphan_files(names):
+    """Пары (вид, имя) файлов пачки, которые не нужны ни одному посту.
+
+    Оригинал нужен, если на него ссылается пост, вариант - если пост
+    ссылается на его оригинал, миниатюра - если она записана в
+    хранилище ключей sorl.
+    """
+    upload_to = Post._meta.get_field('image').upload_to
+    kinds = {}
+    for name in names:
+        if name.startswith(upload_to):
+            kinds[name] = 'original'
+        elif name.startswith(variants.PREFIX + '/'):
+            kinds[name] = 'variant'
+        elif name.startswith(sorl_settings.THUMBNAIL_PREFIX):
+            kinds[name] = 'thumbnail'
+    live = live_images([
+        source
+        for name, kind in kinds.items()
+        for source in (
+            variant_sources(name) if kind == 'variant' else [name]
+        )
+    ])
+    thumbnail_keys = {
+        add_prefix(ImageFile(name, default.storage).key): name
+        for name, kind in kinds.items() if kind == 'thumbnail'
+    }
+    registered = set(
+        KVStoreModel.objects.filter(key__in=thumbnail_keys)
+        .values_list('key', flat=True)
+    )
+    live.update(thumbnail_keys[key] for key in registered)
+    for name, kind in kinds.items():
+        if kind == 'variant':
+            if not live.intersection(variant_sources(name)):
+                yield kind, name
+        elif name not in live:
+            yield kind, name
+
+
+def delete_file(kind, name, min_age):
+    """Удаляет ненужный файл, если он не понадобился после проверки пачки.
+
+    Оригинал за это время могли загрузить снова или сослаться на него из
+    поста, поэтому ссылки и время изменения проверяются заново в той же
+    транзакции, что удаляет запись о файле. Возвращает True, если файл
+    удалён.
+    """
+    if kind != 'original':
+        default_storage.delete(name)
+        return True
+    with transaction.atomic():
+        stored = StoredFile.objects.select_for_update().filter(
+            name=name
+        ).first()
+        if (stored and stored.refs > 0
+                or Post.objects.filter(image=name).exists()
+                or saved_since(name, min_age)):
+            return False
+        if stored:
+            stored.delete()
+        remove(name, min_age)
+    return True
+
+
+def orphan_sources(rows):
+    """Записи sorl об оригиналах, на которые не ссылается ни один пост."""
+    upload_to = Post._meta.get_field('image').upload_to
+    sources = [
+        deserialize_image_file(value) for _, value in rows
+    ]
+    sources = [
+        source for source in sources if source.name.startswith(upload_to)
+    ]
+    live = live_images([source.name for source in sources])
+    return [source for source in sources if source.name not in live]
+
+
+class Checkpoint:
+    """Место, с которого продолжится прерванная сборка мусора.
+
+    Хранится в JSON-файле: этап ('files' или 'kvstore') и последний
+    обработанный путь или ключ. Без path ничего не сохраняется.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.phase, self.position = 'files', ''
+        if path and os.path.exists(path):
+            with open(path) as file:
+                state = json.load(file)
+            self.phase, self.position = state['phase'], state['position']
+
+    def save(self, phase, position):
+        self.phase, self.position = phase, position
+        if not self.path:
+            return
+        temp_path = f'{self.path}.part'
+        with open(temp_path, 'w') as file:
+            json.dump({'phase': phase, 'position': position}, file)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def collect_files(checkpoint, batch_size, min_age, dry_run, report):
+    """Удаляет ненужные оригиналы, варианты и миниатюры из MEDIA_ROOT."""
+    position = tuple(filter(None, checkpoint.position.split('/')))
+    newer = time.time() - min_age
+    files = walk(settings.MEDIA_ROOT, position=position)
+    for batch in batches(files, batch_size):
+        names = [
+            '/'.join(parts) for parts, entry in batch
+            if entry.stat().st_mtime < newer
+        ]
+        for kind, name in orphan_files(names):
+            if dry_run or delete_file(kind, name, min_age):
+                report(kind, name)
+        checkpoint.save('files', '/'.join(batch[-1][0]))
+
+
+def collect_kvstore(checkpoint, batch_size, dry_run, report):
+    """Удаляет записи и миниатюры sorl картинок, которых нет в постах."""
+    prefix = add_prefix('')
+    position = checkpoint.position or prefix
+    while True:
+        rows = list(
+            KVStoreModel.objects.filter(
+                key__startswith=prefix, key__gt=position
+            ).order_by('key').values_list('key', 'value')[:batch_size]
+        )
+        if not rows:
+            return
+        for source in orphan_sources(rows):
+            report('kvstore', source.name)
+            if not dry_run:
+                default.kvstore.delete(source)
+        position = rows[-1][0]
+        checkpoint.save('kvstore', position)
+
+
+def collect_garbage(checkpoint, batch_size, min_age, dry_run, report):
+    """Сборка мусора: сначала файлы MEDIA_ROOT, потом хранилище sorl.
+
+    Обе части идут пачками по batch_size в порядке имён и ключей и после
+    каждой пачки сохраняют checkpoint. Файлы моложе min_age секунд не
+    трогаются: на них может ещё не успеть сослаться сохраняемый пост.
+    """
+    if checkpoint.phase == 'files':
+        collect_files(checkpoint, batch_size, min_age, dry_run, report)
+        checkpoint.save('kvstore', '')
+    collect_kvstore(checkpoint, batch_size, dry_run, report)
+    checkpoint.clear()
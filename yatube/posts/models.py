@@ -1,9 +1,23 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from core.storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
+class PostQuerySet(models.QuerySet):
+
+    def for_listing(self):
+        """Посты для карточек лент: автор и группа одним запросом."""
+        return self.select_related('author', 'group').only(
+            'id', 'text', 'pub_date', 'image', 'comments_count',
+            'author__id', 'author__username',
+            'author__first_name', 'author__last_name',
+            'group__id', 'group__slug', 'group__title',
+        )
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста', help_text='Введите текст поста.'
@@ -21,14 +35,46 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True,
         help_text='Можете добавить картинку'
     )
+    # Размеры заполняются, когда готовы варианты картинки для srcset.
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, editable=False
+    )
+    comments_count = models.IntegerField(
+        'Число комментариев', default=0, editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ('-pub_date',)
+        # Ленты сортируются по ключу (pub_date, id): главная по всем
+        # постам, профиль и группа - по постам автора или группы.
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx',
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx',
+            ),
+            # Посты с данной картинкой: сборка мусора в MEDIA_ROOT и
+            # обновление постов после создания миниатюр.
+            models.Index(fields=['image'], name='post_image_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
@@ -67,6 +113,13 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ('-created',)
+        indexes = [
+            # Постраничный вывод комментариев поста по ключу (created, id).
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
@@ -89,3 +142,77 @@ class Follow(models.Model):
                 name="unique_constraint",
             ),
         ]
+        indexes = [
+            # Подписчики автора: рассылка постов по лентам и счётчики.
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx',
+            ),
+        ]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post', ],
+                name='unique_timeline_entry',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_date_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx',
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE,
+        primary_key=True, related_name='stats'
+    )
+    posts_count = models.IntegerField('Постов', default=0)
+    followers_count = models.IntegerField('Подписчиков', default=0)
+    following_count = models.IntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+
+class StoredFile(models.Model):
+    """Файл хранилища с адресацией по содержимому.
+
+    refs - число постов, ссылающихся на файл: одинаковые картинки
+    хранятся один раз, файл удаляется, когда ссылок не остаётся.
+    """
+    name = models.CharField('Имя файла', max_length=255, primary_key=True)
+    refs = models.IntegerField('Число ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self) -> str:
+        return self.name
@@ -0,0 +1,134 @@
+import base64
+import math
+import re
+
+from django.core.paginator import Page, Paginator
+from django.db import connection
+
+from .utils import NEXT, PREVIOUS, decode_cursor
+
+TABLE = 'posts_post_fts'
+
+WORD_RE = re.compile(r'\w+')
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def create_table(**kwargs):
+    """Создаёт таблицу FTS5; вызывается по сигналу post_migrate."""
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5('
+            "text, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+
+def index_posts(rows):
+    """Добавляет или обновляет посты; rows - пары (id, text)."""
+    rows = list(rows)
+    if not available() or not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {TABLE} WHERE rowid = %s',
+            [(pk,) for pk, _ in rows],
+        )
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)', rows
+        )
+
+
+def remove_post(post_id):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+
+
+def clear():
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+
+
+def match_expression(query):
+    """Запрос пользователя в виде выражения MATCH: все слова, по префиксу.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 во вводе не
+    выполняются и не вызывают синтаксических ошибок.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD_RE.findall(query))
+
+
+def matches(query, limit, position=None, direction=NEXT):
+    """Пары (rank, id) найденных постов по возрастанию bm25.
+
+    position - ключ (rank, id), после (или до) которого идёт выборка.
+    """
+    expression = match_expression(query)
+    if not expression or not available():
+        return []
+    sql = f'SELECT rank, rowid FROM {TABLE} WHERE {TABLE} MATCH %s'
+    params = [expression]
+    if position is not None:
+        lookup = '>' if direction == NEXT else '<'
+        sql += (
+            f' AND (rank {lookup} %s OR (rank = %s AND rowid {lookup} %s))'
+        )
+        params += [position[0], position[0], position[1]]
+    order = '' if direction == NEXT else ' DESC'
+    sql += f' ORDER BY rank{order}, rowid{order} LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def post_ids(query, limit):
+    return [pk for _, pk in matches(query, limit)]
+
+
+def parse_rank(value):
+    rank = float(value)
+    if not math.isfinite(rank):
+        raise ValueError(value)
+    return rank
+
+
+class SearchPaginator(Paginator):
+    """Постраничный вывод результатов поиска по ключу (bm25, id)."""
+
+    cursor_mode = True
+
+    def __init__(self, posts, query, per_page):
+        super().__init__(posts, per_page)
+        self.query = query
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def encode_cursor(self, direction, key):
+        value = '{}{!r}|{}'.format(direction, *key)
+        return base64.urlsafe_b64encode(value.encode()).decode()
+
+    def page(self, cursor=None):
+        direction, position = decode_cursor(cursor, parse_rank)
+        keys = matches(self.query, self.per_page + 1, position, direction)
+        has_more = len(keys) > self.per_page
+        keys = keys[:self.per_page]
+        if direction == PREVIOUS:
+            keys.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+        if keys and has_next:
+            self.next_cursor = self.encode_cursor(NEXT, keys[-1])
+        if keys and has_previous:
+            self.previous_cursor = self.encode_cursor(PREVIOUS, keys[0])
+        posts = self.object_list.in_bulk([pk for _, pk in keys])
+        rows = [posts[pk] for _, pk in keys if pk in posts]
+        return Page(rows, 1, self)
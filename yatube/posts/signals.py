@@ -0,0 +1,208 @@
+import threading
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import caching, feeds, media, search, stats, thumbnails
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+class Deleting(threading.local):
+    """Посты и авторы, которые удаляются в этом потоке.
+
+    Их комментарии удаляются каскадом, и сигнал приходит на каждый;
+    счётчики и кеш для них обновляются один раз в pre_delete.
+    """
+
+    def __init__(self):
+        self.posts = set()
+        self.authors = set()
+
+
+deleting = Deleting()
+
+
+# Поля пользователя, которые выводятся на страницах.
+USER_PAGE_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def user_changing(sender, instance, update_fields, **kwargs):
+    instance._page_fields_changed = False
+    if not instance.pk or (
+            update_fields and not update_fields & set(USER_PAGE_FIELDS)):
+        return
+    old = User.objects.filter(pk=instance.pk).values_list(
+        *USER_PAGE_FIELDS).first()
+    instance._page_fields_changed = old is not None and old != tuple(
+        getattr(instance, field) for field in USER_PAGE_FIELDS
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    # Нового пользователя ещё нет ни на одной странице.
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+    elif instance._page_fields_changed:
+        caching.bump('users')
+        caching.invalidate_cards(author_id=instance.pk)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    deleting.authors.add(instance.pk)
+    # Комментарии пользователя к чужим постам: по запросу на пост.
+    counts = Comment.objects.filter(author=instance).exclude(
+        post__author=instance
+    ).values('post').annotate(count=Count('id')).order_by()
+    post_ids = []
+    for row in counts:
+        Post.objects.filter(id=row['post']).update(
+            comments_count=F('comments_count') - row['count']
+        )
+        post_ids.append(row['post'])
+    bump_posts(post_ids)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    caching.bump('users')
+    deleting.authors.discard(instance.pk)
+
+
+@receiver(pre_save, sender=Group)
+def group_changing(sender, instance, **kwargs):
+    if instance.pk:
+        old_slug = Group.objects.filter(
+            pk=instance.pk).values_list('slug', flat=True).first()
+        caching.bump(f'group:{old_slug}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    caching.bump('groups', f'group:{instance.slug}')
+    caching.invalidate_cards(group_id=instance.pk)
+
+
+@receiver(pre_save, sender=Post)
+def post_changing(sender, instance, **kwargs):
+    if instance.pk:
+        old = Post.objects.filter(pk=instance.pk).values_list(
+            'id', 'author__username', 'group__slug', 'image').first()
+        if old:
+            caching.bump(*caching.post_namespaces(*old[:3]))
+            instance._old_image = old[3]
+            if (instance.image.name or '') != old[3]:
+                # Варианты новой картинки ещё не созданы.
+                instance.image_width = instance.image_height = None
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, update_fields, **kwargs):
+    caching.bump(*caching.post_namespaces(
+        instance.pk, instance.author.username,
+        instance.group and instance.group.slug
+    ))
+    caching.invalidate_cards(post_id=instance.pk)
+    search.index_posts([(instance.pk, instance.text)])
+    # Счётчики ссылок на файлы картинок: одинаковые картинки хранятся
+    # один раз, ненужный файл удаляется вместе с миниатюрами.
+    image = instance.image.name or ''
+    old_image = getattr(instance, '_old_image', '')
+    instance._old_image = image
+    if image != old_image:
+        if image:
+            media.acquire(image)
+        if old_image:
+            media.release(old_image)
+    if instance.image and (not update_fields or 'image' in update_fields):
+        name = instance.image.name
+        transaction.on_commit(lambda: thumbnails.schedule(name))
+    if created:
+        stats.bump(instance.author_id, posts_count=1)
+        feeds.fan_out_post(instance)
+        feeds.recent_posts.changed(instance.author_id)
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    deleting.posts.add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    deleting.posts.discard(instance.pk)
+    caching.bump(*caching.post_namespaces(
+        instance.pk, instance.author.username,
+        instance.group and instance.group.slug
+    ))
+    stats.bump(instance.author_id, posts_count=-1)
+    feeds.recent_posts.changed(instance.author_id)
+    search.remove_post(instance.pk)
+    if instance.image:
+        media.release(instance.image.name)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    caching.bump(
+        f'profile:{instance.author.username}',
+        f'profile:{instance.user.username}', f'feed:{instance.user_id}',
+    )
+    if created:
+        stats.bump(instance.author_id, followers_count=1)
+        stats.bump(instance.user_id, following_count=1)
+        feeds.backfill_timeline(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    caching.bump(
+        f'profile:{instance.author.username}',
+        f'profile:{instance.user.username}', f'feed:{instance.user_id}',
+    )
+    if instance.author_id not in deleting.authors:
+        feeds.drop_follower(instance.author_id)
+    stats.bump(instance.user_id, following_count=-1)
+    feeds.prune_timeline(instance.user_id, instance.author_id)
+
+
+def bump_posts(post_ids):
+    """Сбрасывает кеш страниц и карточек постов одним вызовом."""
+    namespaces = set()
+    for post in Post.objects.filter(id__in=post_ids).values_list(
+            'id', 'author__username', 'group__slug'):
+        namespaces.update(caching.post_namespaces(*post))
+    for post_id in post_ids:
+        namespaces.update(caching.card_tags(post_id))
+    if namespaces:
+        caching.bump(*sorted(namespaces))
+
+
+def bump_comment_post(comment):
+    bump_posts([comment.post_id])
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(id=instance.post_id).update(
+            comments_count=F('comments_count') + 1
+        )
+        bump_comment_post(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if (instance.post_id in deleting.posts
+            or instance.author_id in deleting.authors):
+        return
+    Post.objects.filter(id=instance.post_id).update(
+        comments_count=F('comments_count') - 1
+    )
+    bump_comment_post(instance)
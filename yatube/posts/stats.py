@@ -0,0 +1,62 @@
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Follow, Post, User, UserStats
+
+
+def bump(user_id, **deltas):
+    UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def _counts(queryset, field, user_ids):
+    return dict(
+        queryset.filter(**{f'{field}__in': user_ids})
+        .order_by()
+        .values_list(field)
+        .annotate(Count('id'))
+    )
+
+
+@transaction.atomic
+def rebuild(user_ids):
+    user_ids = list(User.objects.filter(id__in=user_ids).values_list(
+        'id', flat=True
+    ))
+    posts = _counts(Post.objects, 'author', user_ids)
+    followers = _counts(Follow.objects, 'author', user_ids)
+    following = _counts(Follow.objects, 'user', user_ids)
+    existing = set(UserStats.objects.filter(user__in=user_ids).values_list(
+        'user_id', flat=True
+    ))
+    stats = [
+        UserStats(
+            user_id=user_id,
+            posts_count=posts.get(user_id, 0),
+            followers_count=followers.get(user_id, 0),
+            following_count=following.get(user_id, 0),
+        )
+        for user_id in user_ids
+    ]
+    UserStats.objects.bulk_update(
+        [item for item in stats if item.user_id in existing],
+        ('posts_count', 'followers_count', 'following_count'),
+    )
+    UserStats.objects.bulk_create(
+        [item for item in stats if item.user_id not in existing],
+        ignore_conflicts=True,
+    )
+
+
+def get(user_id):
+    """Счётчики пользователя.
+
+    У пользователей, созданных до появления счётчиков, строки нет: она
+    считается по данным при первом обращении.
+    """
+    stats = UserStats.objects.filter(user_id=user_id).first()
+    if stats is None:
+        rebuild([user_id])
+        stats = UserStats.objects.filter(user_id=user_id).first()
+    return stats
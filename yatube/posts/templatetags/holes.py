@@ -0,0 +1,15 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts import holes
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, *args):
+    request = context['request']
+    args = [str(arg) for arg in args]
+    if getattr(request, 'punch_holes', False):
+        return mark_safe(holes.marker(name, args))
+    return mark_safe(holes.render(request, name, args))
@@ -0,0 +1,46 @@
+from django import template
+from django.core.files.storage import default_storage
+
+from posts import variants
+
+register = template.Library()
+
+
+def srcset(name, image_width, image_format):
+    return ', '.join(
+        '{} {}w'.format(
+            default_storage.url(
+                variants.variant_name(name, width, image_format)
+            ),
+            actual,
+        )
+        for width, actual in variants.widths(image_width)
+    )
+
+
+@register.inclusion_tag('includes/picture.html')
+def picture(post, sizes='100vw'):
+    """<picture> с вариантами картинки поста разной ширины и формата.
+
+    Выводится, когда варианты готовы (у поста заполнены размеры
+    картинки); браузер сам выбирает формат и ширину по sizes.
+    """
+    name = post.image.name
+    *modern, legacy = variants.formats(name)
+    largest = variants.widths(post.image_width)[-1][0]
+    return {
+        'sources': [
+            {
+                'type': variants.mime_type(image_format),
+                'srcset': srcset(name, post.image_width, image_format),
+            }
+            for image_format in modern
+        ],
+        'src': default_storage.url(
+            variants.variant_name(name, largest, legacy)
+        ),
+        'srcset': srcset(name, post.image_width, legacy),
+        'sizes': sizes,
+        'width': post.image_width,
+        'height': post.image_height,
+    }
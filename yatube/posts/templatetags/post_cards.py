@@ -0,0 +1,30 @@
+from django import template
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from posts import caching, thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_card(post):
+    content = caching.cached(
+        caching.card_key(post),
+        lambda: get_template('includes/post_card.html').render(
+            {'post': post}
+        ),
+        settings.CARD_CACHE_TIMEOUT,
+        stale_key=f'posts:latest-card:{post.id}',
+    )
+    return mark_safe(content)
+
+
+@register.simple_tag
+def prefetch_thumbnails(page_obj, geometry_string, **options):
+    """Загружает миниатюры всех постов страницы одной пачкой."""
+    thumbnails.prefetch(
+        [post.image for post in page_obj], geometry_string, **options
+    )
+    return ''
@@ -0,0 +1,38 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from posts import caching
+
+
+class CachedTests(SimpleTestCase):
+
+    def test_value_computed_once(self):
+        """Значение считается один раз до истечения срока."""
+        compute = mock.Mock(return_value='value')
+        for _ in range(3):
+            self.assertEqual(caching.cached('test:key', compute, 60), 'value')
+        compute.assert_called_once()
+
+    def test_early_recompute_near_expiry(self):
+        """Запись, близкая к истечению, пересчитывается заранее."""
+        cache.set('test:key', ('old', 0, 1))
+        self.assertEqual(caching.cached('test:key', lambda: 'new', 60), 'new')
+
+    def test_locked_key_returns_stale_value(self):
+        """Пока другой процесс пересчитывает запись, отдаётся прежняя."""
+        cache.set('test:latest', 'stale')
+        cache.add('test:key:lock', 1)
+        compute = mock.Mock(return_value='new')
+        value = caching.cached(
+            'test:key', compute, 60, stale_key='test:latest'
+        )
+        self.assertEqual(value, 'stale')
+        compute.assert_not_called()
+
+    def test_uncacheable_value_not_stored(self):
+        """None от compute не кешируется и снимает блокировку."""
+        self.assertIsNone(caching.cached('test:key', lambda: None, 60))
+        self.assertIsNone(cache.get('test:key'))
+        self.assertTrue(cache.add('test:key:lock', 1))
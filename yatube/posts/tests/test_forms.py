@@ -1,17 +1,26 @@
+import io
+import os
 import shutil
 import tempfile
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
-from posts.models import Comment, Group, Post
+from posts import images, thumbnails
+from posts.forms import PostForm
+from posts.models import Comment, Group, Post, StoredFile
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
+HASHED_NAME = r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$'
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostViewsTests(TestCase):
@@ -67,7 +76,113 @@ class PostViewsTests(TestCase):
         self.assertEqual(post.text, form_data['text'])
         self.assertEqual(post.group, self.group)
         self.assertEqual(post.author, self.user)
-        self.assertEqual(post.image, f'posts/{uploaded}')
+        # Картинка перекодирована в JPEG и названа по хешу содержимого.
+        self.assertRegex(post.image.name, HASHED_NAME)
+
+    @override_settings(IMAGE_MAX_SIZE=100)
+    def test_image_normalized(self):
+        """Картинка поворачивается по EXIF, уменьшается и очищается."""
+        source = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повёрнута на 90 градусов.
+        exif[0x010F] = 'Camera'  # Make.
+        Image.new('RGB', (300, 100), 'red').save(source, 'JPEG', exif=exif)
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Фото', 'image': SimpleUploadedFile(
+                name='photo.jpeg', content=source.getvalue(),
+                content_type='image/jpeg'
+            )},
+        )
+        self.assertIn('image-decode', response['Server-Timing'])
+        post = Post.objects.get(text='Фото')
+        self.assertRegex(post.image.name, HASHED_NAME)
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (33, 100))
+            self.assertFalse(image.getexif())
+            self.assertTrue(image.info.get('progressive'))
+
+    def test_broken_pool_falls_back(self):
+        """Если пул процессов сломан, картинка обрабатывается в запросе."""
+        content = io.BytesIO()
+        Image.new('RGB', (10, 10), 'green').save(content, 'JPEG')
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool
+        with mock.patch.object(images, '_executor', broken):
+            response = self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Без пула', 'image': SimpleUploadedFile(
+                    name='pool.jpg', content=content.getvalue(),
+                    content_type='image/jpeg'
+                )},
+            )
+            self.assertIsNot(images._executor, broken)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('image-decode', response['Server-Timing'])
+        self.assertRegex(
+            Post.objects.get(text='Без пула').image.name, HASHED_NAME
+        )
+        broken.shutdown.assert_called_once()
+        self.assertIsNot(PostForm().image_timings, PostForm().image_timings)
+
+    @override_settings(MEDIA_REUSE_GRACE=0)
+    def test_identical_images_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом до последней ссылки."""
+        content = io.BytesIO()
+        Image.new('RGB', (10, 10), 'blue').save(content, 'JPEG')
+        for text in ('Первый', 'Второй'):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': text, 'image': SimpleUploadedFile(
+                    name=f'{text}.jpg', content=content.getvalue(),
+                    content_type='image/jpeg'
+                )},
+            )
+        first = Post.objects.get(text='Первый')
+        second = Post.objects.get(text='Второй')
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 2)
+        thumbnails.generate(name)
+        variants = os.path.join(TEMP_MEDIA_ROOT, 'variants', name[:-4])
+        self.assertTrue(os.listdir(variants))
+        with mock.patch('posts.media.transaction') as transaction:
+            transaction.on_commit.side_effect = lambda func: func()
+            first.delete()
+            self.assertTrue(os.path.exists(second.image.path))
+            second.delete()
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.assertFalse(os.path.exists(second.image.path))
+        self.assertFalse(os.path.exists(variants))
+
+    def test_reused_image_not_removed(self):
+        """Файл, который только что загрузили снова, не удаляется."""
+        content = io.BytesIO()
+        Image.new('RGB', (10, 10), 'red').save(content, 'JPEG')
+        post = Post.objects.create(
+            author=self.user, text='Старый',
+            image=SimpleUploadedFile('old.jpg', content.getvalue()),
+        )
+        path = post.image.path
+        os.utime(path, (0, 0))
+        with mock.patch('posts.media.transaction') as transaction:
+            transaction.on_commit.side_effect = lambda func: func()
+            post.delete()
+        self.assertFalse(os.path.exists(path))
+        post = Post.objects.create(
+            author=self.user, text='Старый',
+            image=SimpleUploadedFile('old.jpg', content.getvalue()),
+        )
+        os.utime(path, (0, 0))
+        # Загрузка того же содержимого, пост с которой ещё не сохранён.
+        Post._meta.get_field('image').storage.save(
+            'posts/new.jpg', SimpleUploadedFile('new.jpg', content.getvalue())
+        )
+        self.assertGreater(os.path.getmtime(path), 0)
+        with mock.patch('posts.media.transaction') as transaction:
+            transaction.on_commit.side_effect = lambda func: func()
+            post.delete()
+        self.assertTrue(os.path.exists(path))
 
     def test_edit_post(self):
         """Проверка редактирования поста."""
@@ -165,6 +280,11 @@ class PostViewsTests(TestCase):
         self.assertEqual(Comment.objects.count(), comment_count + 1)
         self.assertEqual(comment.text, form_data['text'])
         self.assertEqual(comment.author, self.user)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
 
     def test_create_comment_not_authorized(self):
         """Проверка попытки создания записи комментария."""
@@ -1,9 +1,25 @@
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail.models import KVStore
 
-from ..models import Group, Post
+from .. import media, thumbnails
+from ..models import Comment, Follow, Group, Post, StoredFile, UserStats
 
 User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 class PostModelTest(TestCase):
@@ -31,3 +47,216 @@ class PostModelTest(TestCase):
         for objects, name in object_name:
             with self.subTest(objects=objects):
                 self.assertEqual(objects, str(name))
+
+    def test_recount_comments_command(self):
+        """Команда recount_comments исправляет счётчик комментариев."""
+        Comment.objects.create(post=self.post, author=self.user, text='К')
+        Post.objects.filter(id=self.post.id).update(comments_count=100)
+        call_command('recount_comments', batch_size=1, stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+    def delete_queries(self, comments):
+        post = Post.objects.create(author=self.user, text='Обсуждаемый')
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.user, text='К')
+            for _ in range(comments)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            post.delete()
+        return len(queries)
+
+    def test_post_delete_does_not_touch_each_comment(self):
+        """Удаление поста не обновляет счётчик на каждый комментарий."""
+        self.assertEqual(self.delete_queries(2), self.delete_queries(30))
+
+    def test_user_delete_updates_comment_counters(self):
+        """Удаление автора уменьшает счётчики чужих постов разом."""
+        commenter = User.objects.create_user(username='Mr.Comment')
+        own_post = Post.objects.create(author=commenter, text='Свой')
+        for _ in range(3):
+            Comment.objects.create(
+                post=self.post, author=commenter, text='К'
+            )
+        Comment.objects.create(post=own_post, author=commenter, text='К')
+        Comment.objects.create(post=own_post, author=self.user, text='К')
+        Comment.objects.create(post=self.post, author=self.user, text='К')
+        commenter.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(self.post.comments.count(), 1)
+
+
+class UserStatsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mr.X')
+        cls.follower = User.objects.create_user(username='Mr.Y')
+
+    def assertStats(self, user, posts, followers, following):
+        stats = UserStats.objects.get(user=user)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count, stats.following_count),
+            (posts, followers, following)
+        )
+
+    def test_stats_follow_posts_and_follows(self):
+        """Счётчики обновляются при создании и удалении постов и подписок."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Post.objects.create(author=self.author, text='Пост')
+        follow = Follow.objects.create(user=self.follower, author=self.author)
+        self.assertStats(self.author, 2, 1, 0)
+        self.assertStats(self.follower, 0, 0, 1)
+        post.delete()
+        follow.delete()
+        self.assertStats(self.author, 1, 0, 0)
+        self.assertStats(self.follower, 0, 0, 0)
+
+    def test_rebuild_stats_command(self):
+        """Команда rebuild_stats исправляет расхождения счётчиков."""
+        Post.objects.create(author=self.author, text='Пост')
+        Follow.objects.create(user=self.follower, author=self.author)
+        UserStats.objects.update(
+            posts_count=100, followers_count=100, following_count=100
+        )
+        UserStats.objects.filter(user=self.follower).delete()
+        call_command('rebuild_stats', batch_size=1, stdout=StringIO())
+        self.assertStats(self.author, 1, 1, 0)
+        self.assertStats(self.follower, 0, 0, 1)
+
+    def test_missing_stats_created_on_read(self):
+        """Счётчики старых пользователей считаются при первом показе."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Follow.objects.create(user=self.follower, author=self.author)
+        UserStats.objects.all().delete()
+        response = self.client.get(
+            reverse('posts:profile', args=(self.author.username,))
+        )
+        self.assertContains(response, 'Всего постов: 1')
+        self.assertContains(response, 'Подписчиков: 1')
+        self.assertStats(self.author, 1, 1, 0)
+        UserStats.objects.all().delete()
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.id,))
+        )
+        self.assertContains(response, 'Всего постов автора:  <span >1</span>')
+        self.assertStats(self.author, 1, 1, 0)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaGarbageTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='Mr.X')
+        self.live = self.create_post('blue')
+        self.orphan = self.create_post('red')
+        self.orphan_name = self.orphan.image.name
+        # Файлы удаляются после коммита, которого в тесте нет: так же
+        # остаются файлы, если процесс упал до удаления.
+        Post.objects.filter(pk=self.orphan.pk).delete()
+        self.checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'gc.json')
+
+    def create_post(self, color):
+        content = BytesIO()
+        Image.new('RGB', (400, 200), color).save(content, 'JPEG')
+        post = Post.objects.create(
+            author=self.author,
+            text=f'Пост с картинкой {color}',
+            image=SimpleUploadedFile(
+                name=f'{color}.jpg',
+                content=content.getvalue(),
+                content_type='image/jpeg',
+            ),
+        )
+        thumbnails.generate(post.image.name)
+        return post
+
+    def media_files(self, name):
+        """Оригинал и варианты картинки, миниатюры - по записям sorl."""
+        stem = os.path.splitext(name)[0]
+        files = [os.path.join(TEMP_MEDIA_ROOT, name)]
+        for root, _, names in os.walk(
+            os.path.join(TEMP_MEDIA_ROOT, 'variants', stem)
+        ):
+            files.extend(os.path.join(root, file) for file in names)
+        return [file for file in files if os.path.exists(file)]
+
+    def gc_media(self, *args):
+        out = StringIO()
+        call_command(
+            'gc_media', '--min-age=0', '--batch-size=2',
+            f'--checkpoint={self.checkpoint}', *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def thumbnail_records(self):
+        return KVStore.objects.filter(value__contains='"cache/').count()
+
+    def test_dry_run_deletes_nothing(self):
+        """Пробный запуск только считает ненужные файлы."""
+        files = self.media_files(self.orphan_name)
+        records = self.thumbnail_records()
+        output = self.gc_media('--dry-run')
+        self.assertIn('Будет удалено', output)
+        self.assertIn('original 1', output)
+        self.assertEqual(self.media_files(self.orphan_name), files)
+        self.assertEqual(self.thumbnail_records(), records)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_orphans_deleted(self):
+        """Удаляются файлы и миниатюры картинок без постов."""
+        live_files = self.media_files(self.live.image.name)
+        records = self.thumbnail_records()
+        self.assertGreater(len(self.media_files(self.orphan_name)), 1)
+        self.gc_media()
+        self.assertEqual(self.media_files(self.orphan_name), [])
+        self.assertFalse(
+            StoredFile.objects.filter(name=self.orphan_name).exists()
+        )
+        self.assertEqual(self.media_files(self.live.image.name), live_files)
+        self.assertEqual(
+            self.thumbnail_records(), records - len(settings.POST_THUMBNAILS)
+        )
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertIn('Ненужных файлов нет.', self.gc_media())
+
+    def test_resume_from_checkpoint(self):
+        """Сборка продолжается с сохранённого места."""
+        with open(self.checkpoint, 'w') as file:
+            json.dump({'phase': 'kvstore', 'position': ''}, file)
+        records = self.thumbnail_records()
+        output = self.gc_media()
+        # Обход файлов уже пройден: оригинал остался, миниатюры удалены.
+        self.assertIn('kvstore 1', output)
+        self.assertNotIn('original', output)
+        self.assertTrue(
+            os.path.exists(os.path.join(TEMP_MEDIA_ROOT, self.orphan_name))
+        )
+        self.assertEqual(
+            self.thumbnail_records(), records - len(settings.POST_THUMBNAILS)
+        )
+        self.gc_media('--restart')
+        self.assertEqual(self.media_files(self.orphan_name), [])
+
+    def test_reused_original_kept(self):
+        """Оригинал, понадобившийся после проверки пачки, не удаляется."""
+        path = os.path.join(TEMP_MEDIA_ROOT, self.orphan_name)
+        stored = StoredFile.objects.create(name=self.orphan_name, refs=1)
+        self.assertFalse(media.delete_file('original', self.orphan_name, 0))
+        self.assertTrue(os.path.exists(path))
+        stored.delete()
+        # Тот же файл только что загрузили снова.
+        os.utime(path)
+        self.assertFalse(
+            media.delete_file('original', self.orphan_name, 3600)
+        )
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(media.delete_file('original', self.orphan_name, 0))
+        self.assertFalse(os.path.exists(path))
@@ -0,0 +1,134 @@
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import feeds
+from posts.models import Comment, Follow, Group, Post, TimelineEntry
+
+User = get_user_model()
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+( AS \w+)?$')
+
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+class QueryPlanTests(TestCase):
+    """Горячие запросы представлений идут по индексам.
+
+    Каждый SELECT, выполненный представлением, проверяется через
+    EXPLAIN QUERY PLAN: полный просмотр таблицы или сортировка во
+    временном B-дереве означают, что запросу не хватает индекса.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание группы',
+        )
+        cls.authors = [
+            User.objects.create_user(username=f'Author{author_num}')
+            for author_num in range(3)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+            for post_num in range(settings.PAGINATOR_PAGE + 2):
+                Post.objects.create(
+                    author=author,
+                    text='Пост №%s!' % post_num,
+                    group=cls.group if post_num % 2 else None,
+                )
+        cls.post = Post.objects.first()
+        for comment_num in range(settings.COMMENTS_PAGE + 2):
+            Comment.objects.create(
+                post=cls.post,
+                author=cls.authors[comment_num % 3],
+                text='Комментарий №%s!' % comment_num,
+            )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def assertIndexedPlans(self, queries):
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                with self.subTest(sql=sql, step=step):
+                    self.assertIsNone(FULL_SCAN.match(step))
+                    self.assertNotIn(TEMP_SORT, step)
+
+    def assertViewIndexed(self, client, address, cursor_name='cursor'):
+        """Проверяет первую страницу и страницу по курсору."""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(address)
+        self.assertEqual(response.status_code, 200)
+        self.assertIndexedPlans(queries.captured_queries)
+        page = response.context.get(cursor_name)
+        if page is None or not page.paginator.next_cursor:
+            return
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            client.get(address, {'cursor': page.paginator.next_cursor})
+        self.assertIndexedPlans(queries.captured_queries)
+
+    def test_listing_plans(self):
+        """Ленты главной, группы и профиля читаются по индексам."""
+        addresses = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.authors[0].username,)),
+        )
+        for address in addresses:
+            with self.subTest(address=address):
+                self.assertViewIndexed(self.client, address, 'page_obj')
+
+    def test_comment_plans(self):
+        """Комментарии поста читаются по индексу."""
+        self.assertViewIndexed(
+            self.authorized_client,
+            reverse('posts:post_detail', args=(self.post.id,)),
+            'comments',
+        )
+        self.assertViewIndexed(
+            self.client,
+            reverse('posts:post_comments', args=(self.post.id,)),
+            'comments',
+        )
+
+    @override_settings(FOLLOW_FEED_STRATEGY='materialized')
+    def test_follow_feed_plans(self):
+        """Материализованная лента подписок читается по индексу.
+
+        Стратегии 'sql' и 'merge' сортируют во временном B-дереве
+        намеренно: первая сливает посты нескольких авторов, вторая -
+        не больше страницы постов, выбранных по первичному ключу.
+        """
+        self.assertViewIndexed(
+            self.authorized_client, reverse('posts:follow_index'), 'page_obj'
+        )
+
+    def test_timeline_maintenance_plans(self):
+        """Рассылка постов по лентам ищет подписчиков по индексу."""
+        with CaptureQueriesContext(connection) as queries:
+            Post.objects.create(author=self.authors[0], text='Новый пост')
+            feeds.prune_timeline(self.reader.id, self.authors[1].id)
+            feeds.backfill_timeline(self.reader.id, self.authors[1].id)
+        self.assertIndexedPlans(queries.captured_queries)
+        self.assertTrue(
+            TimelineEntry.objects.filter(author=self.authors[1]).exists()
+        )
@@ -1,18 +1,39 @@
+import base64
+import json
+import re
 import shutil
 import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default
 
+from posts import feeds, search, thumbnails, utils, variants, warmup
 from posts.forms import PostForm
-from posts.models import Follow, Group, Post
+from posts.models import Comment, Follow, Group, Post, TimelineEntry
+from posts.utils import NEXT
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00'
+    b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+    b'\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -65,7 +86,6 @@ class PostViewsTests(TestCase):
             ('post_edit', (self.post.id,), 'post_create.html'),
             ('post_create', None, 'post_create.html')
         )
-        cache.clear()
         for name, args, template in templates_page_names:
             with self.subTest(name=name):
                 response = self.authorized_client.get(
@@ -75,7 +95,6 @@ class PostViewsTests(TestCase):
 
     def test_index_page_show_correct_context(self):
         """Шаблон index сформирован с правильным контекстом."""
-        cache.clear()
         response = self.client.get(reverse('posts:index'))
         self.check_post(response, is_page=True)
 
@@ -141,6 +160,188 @@ class PostViewsTests(TestCase):
         self.assertEqual(post.image, self.post.image)
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_templates_sizes_pregenerated(self):
+        """Все размеры миниатюр из шаблонов создаются заранее."""
+        sizes = {geometry for geometry, _ in settings.POST_THUMBNAILS}
+        templates = Path(settings.TEMPLATES[0]['DIRS'][0]).rglob('*.html')
+        for template in templates:
+            for size in re.findall(
+                r'{%\s*(?:prefetch_)?thumbnails?\s+\S+\s+"([^"]+)"',
+                template.read_text()
+            ):
+                with self.subTest(template=template.name, size=size):
+                    self.assertIn(size, sizes)
+
+    def test_placeholder_until_generated(self):
+        """Пока миниатюры нет, выводится заглушка, потом - миниатюра."""
+        post = Post.objects.create(
+            author=User.objects.create_user(username='Mr.X'),
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name='thumb.gif',
+                content=SMALL_GIF,
+                content_type='image/gif',
+            ),
+        )
+        placeholder = settings.STATIC_URL + settings.THUMBNAIL_PLACEHOLDER
+        with mock.patch.object(thumbnails, 'background', return_value=True):
+            with mock.patch.object(thumbnails, 'schedule') as schedule:
+                response = self.client.get(reverse('posts:index'))
+            self.assertContains(response, placeholder)
+            schedule.assert_called_with(post.image.name)
+            thumbnails.generate(post.image.name)
+            response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, placeholder)
+        self.assertContains(response, settings.MEDIA_URL + 'cache/')
+
+    def test_page_thumbnails_prefetched(self):
+        """Миниатюры страницы читаются из хранилища одним запросом."""
+        author = User.objects.create_user(username='Mr.X')
+        for post_num in range(3):
+            Post.objects.create(
+                author=author,
+                text='Пост №%s' % post_num,
+                image=SimpleUploadedFile(
+                    name=f'prefetch{post_num}.gif',
+                    content=SMALL_GIF,
+                    content_type='image/gif',
+                ),
+            )
+        self.client.get(reverse('posts:index'))
+        cache.clear()
+        # Страница постов и записи всех миниатюр.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, settings.MEDIA_URL + 'cache/', 3)
+
+    def create_photo_post(self):
+        content = BytesIO()
+        Image.new('RGB', (700, 350), 'green').save(content, 'JPEG')
+        return Post.objects.create(
+            author=User.objects.create_user(username='Mr.X'),
+            text='Пост с фотографией',
+            image=SimpleUploadedFile(
+                name='photo.jpg',
+                content=content.getvalue(),
+                content_type='image/jpeg',
+            ),
+        )
+
+    def test_prefetched_thumbnails_forgotten(self):
+        """Непрочитанные записи миниатюр не достаются следующему запросу."""
+        post = self.create_photo_post()
+        thumbnails.generate(post.image.name)
+        geometry, options = settings.POST_THUMBNAILS[0]
+        backend = thumbnails.BackgroundThumbnailBackend()
+        thumbnail = backend.thumbnail_file(post.image, geometry, dict(options))
+        thumbnails.prefetch([post.image], geometry, **options)
+        self.client.get(reverse('about:author'))
+        default.kvstore.delete(thumbnail)
+        self.assertIsNone(
+            backend.get_ready_thumbnail(post.image, geometry, dict(options))
+        )
+
+    def test_picture_variants(self):
+        """Страница поста выводит <picture> с вариантами разной ширины."""
+        post = self.create_photo_post()
+        thumbnails.generate(post.image.name)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (700, 350))
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.id,))
+        )
+        self.assertContains(response, '<picture>')
+        for width, actual in ((320, 320), (640, 640), (960, 700)):
+            variant = variants.variant_name(post.image.name, width, 'JPEG')
+            with self.subTest(width=width):
+                self.assertContains(
+                    response, f'{settings.MEDIA_URL}{variant} {actual}w'
+                )
+                with Image.open(Path(TEMP_MEDIA_ROOT, variant)) as image:
+                    self.assertEqual(image.width, actual)
+        self.assertNotContains(response, '1280.jpg')
+
+    def test_edited_image_variants(self):
+        """После замены картинки размеры и варианты берутся от новой."""
+        post = self.create_photo_post()
+        thumbnails.generate(post.image.name)
+        content = BytesIO()
+        Image.new('RGB', (500, 900), 'blue').save(content, 'JPEG')
+        client = Client()
+        client.force_login(post.author)
+        client.post(
+            reverse('posts:post_edit', args=(post.id,)),
+            {
+                'text': post.text,
+                'image': SimpleUploadedFile(
+                    name='portrait.jpg',
+                    content=content.getvalue(),
+                    content_type='image/jpeg',
+                ),
+            },
+        )
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (None, None))
+        thumbnails.generate(post.image.name)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (500, 900))
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.id,))
+        )
+        self.assertContains(response, 'width="500" height="900"')
+        for width, actual in ((320, 320), (640, 500)):
+            variant = variants.variant_name(post.image.name, width, 'JPEG')
+            with self.subTest(width=width):
+                self.assertContains(
+                    response, f'{settings.MEDIA_URL}{variant} {actual}w'
+                )
+                self.assertTrue(Path(TEMP_MEDIA_ROOT, variant).exists())
+        self.assertNotContains(response, '960.jpg')
+
+    def test_variant_negotiated(self):
+        """Формат варианта выбирается по Accept, файл кешируется на диске."""
+        post = self.create_photo_post()
+        with mock.patch.object(
+            variants, 'formats', return_value=['WEBP', 'JPEG']
+        ):
+            for accept, image_format in (
+                ('image/webp,*/*;q=0.8', 'WEBP'),
+                ('image/webp;q=0, image/*', 'JPEG'),
+                ('*/*', 'JPEG'),
+            ):
+                with self.subTest(accept=accept):
+                    self.assertEqual(
+                        variants.negotiate(accept, post.image.name),
+                        image_format,
+                    )
+        address = reverse('posts:image_variant', args=(320, post.image.name))
+        response = self.client.get(address, HTTP_ACCEPT='image/*')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('Accept', response['Vary'])
+        self.assertIn('immutable', response['Cache-Control'])
+        content = b''.join(response.streaming_content)
+        with Image.open(BytesIO(content)) as image:
+            self.assertEqual(image.size, (320, 160))
+        self.assertTrue(Path(
+            TEMP_MEDIA_ROOT,
+            variants.variant_name(post.image.name, 320, 'JPEG'),
+        ).exists())
+        for address in (
+            reverse('posts:image_variant', args=(300, post.image.name)),
+            reverse('posts:image_variant', args=(320, 'posts/unknown.jpg')),
+        ):
+            with self.subTest(address=address):
+                self.assertEqual(self.client.get(address).status_code, 404)
+
+
 class PaginatorViewsTest(TestCase):
 
     @classmethod
@@ -164,7 +365,6 @@ class PaginatorViewsTest(TestCase):
 
     def test_first_page_contains_correct_records(self):
         """Проверка что на первой странице выведено PAGINATOR_PAGE постов."""
-        cache.clear()
         response = self.client.get(reverse('posts:index'))
         self.assertEqual(
             len(response.context['page_obj']), settings.PAGINATOR_PAGE
@@ -181,6 +381,75 @@ class PaginatorViewsTest(TestCase):
         self.assertEqual(
             len(response.context['page_obj']), posts_number)
 
+    def test_cursor_pages_contains_correct_records(self):
+        """Проверка постраничного вывода по курсору."""
+        address = reverse('posts:group_posts', args=(self.group.slug,))
+        response = self.client.get(address)
+        first_page = list(response.context['page_obj'])
+        paginator = response.context['page_obj'].paginator
+        self.assertEqual(len(first_page), settings.PAGINATOR_PAGE)
+        self.assertIsNone(paginator.previous_cursor)
+        response = self.client.get(
+            address, {'cursor': paginator.next_cursor}
+        )
+        second_page = list(response.context['page_obj'])
+        paginator = response.context['page_obj'].paginator
+        self.assertEqual(
+            len(second_page), self.number_posts - settings.PAGINATOR_PAGE
+        )
+        self.assertFalse(set(first_page) & set(second_page))
+        self.assertIsNone(paginator.next_cursor)
+        response = self.client.get(
+            address, {'cursor': paginator.previous_cursor}
+        )
+        self.assertEqual(list(response.context['page_obj']), first_page)
+
+    def test_cursor_page_does_not_count(self):
+        """Страница по курсору не выполняет COUNT."""
+        address = reverse('posts:group_posts', args=(self.group.slug,))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(address, {'cursor': 'broken'})
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT', query['sql'])
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_invalid_cursor_first_page(self):
+        """Испорченный курсор ведёт на первую страницу, а не к ошибке."""
+        def encode(value):
+            return base64.urlsafe_b64encode(value.encode()).decode()
+
+        cursors = (
+            encode('n2020-01-01T00:00:00+00:00|' + '9' * 30),
+            encode('n2020-01-01T00:00:00+00:00|0'),
+            encode('n2020-01-01T00:00:00|5'),
+            encode('pnan|5'),
+        )
+        address = reverse('posts:group_posts', args=(self.group.slug,))
+        first_page = list(self.client.get(address).context['page_obj'])
+        post = first_page[0]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(utils.decode_cursor(cursor), (NEXT, None))
+                response = self.client.get(address, {'cursor': cursor})
+                self.assertEqual(
+                    list(response.context['page_obj']), first_page
+                )
+                for other in (
+                    reverse('posts:api_index'),
+                    reverse('posts:post_comments', args=(post.id,)),
+                ):
+                    response = self.client.get(other, {'cursor': cursor})
+                    self.assertEqual(response.status_code, 200)
+                feeds.merge_feed(self.user, cursor)
+        for rank in ('nan', 'inf', '-inf'):
+            with self.subTest(rank=rank):
+                self.assertEqual(
+                    utils.decode_cursor(
+                        encode(f'n{rank}|5'), search.parse_rank
+                    ),
+                    (NEXT, None),
+                )
+
 
 class PostCreateTests(TestCase):
 
@@ -219,7 +488,6 @@ class PostCreateTests(TestCase):
         Проверка что созданный пост попал
         на страницы index, group и profile
         """
-        cache.clear()
         for reverse_name in self.page_name:
             with self.subTest(reverse_name=reverse_name):
                 response = self.client.get(reverse_name)
@@ -248,13 +516,303 @@ class PostCacheTests(TestCase):
 
     def test_cash_index(self):
         """Проверка кеширования страницы index"""
-        cache.clear()
         response = self.client.get(reverse('posts:index'))
         content_1 = response.content
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(content_1, response.content)
+
+    def test_post_card_invalidated_by_group(self):
+        """Изменение группы сбрасывает карточки её постов."""
+        group = Group.objects.create(
+            title='Старое название', slug='cards', description='Описание'
+        )
+        self.post_cache.group = group
+        self.post_cache.save()
+        post = Post.objects.for_listing().get(id=self.post_cache.id)
+        template = Template('{% load post_cards %}{% post_card post %}')
+        self.assertIn('Старое название', template.render(Context({
+            'post': post
+        })))
+        group.title = 'Новое название'
+        group.save()
+        post = Post.objects.for_listing().get(id=self.post_cache.id)
+        self.assertIn('Новое название', template.render(Context({
+            'post': post
+        })))
+
+    def test_cache_invalidated_on_change(self):
+        """Изменение поста сразу сбрасывает кеш страниц списков."""
+        addresses = (
+            reverse('posts:index'),
+            reverse('posts:profile', args=(self.user.username,)),
+        )
+        for address in addresses:
+            self.client.get(address)
+        self.post_cache.text = 'Новый текст поста'
+        self.post_cache.save()
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertContains(response, 'Новый текст поста')
         self.post_cache.delete()
-        response = self.client.get(reverse('posts:index'))
-        content_2 = response.content
-        self.assertEqual(content_1, content_2)
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertNotContains(response, 'Новый текст поста')
+
+    def test_cached_page_shared_between_users(self):
+        """Страница кешируется одна на всех, личные части свои у каждого."""
+        reader = User.objects.create_user(username='Mr.Reader')
+        author_client = Client()
+        author_client.force_login(self.user)
+        reader_client = Client()
+        reader_client.force_login(reader)
+        post = Post.objects.create(author=self.user, text='Общий пост')
+        address = reverse('posts:post_detail', args=(post.id,))
+        edit = reverse('posts:post_edit', args=(post.id,))
+        response = author_client.get(address)
+        self.assertContains(response, edit)
+        self.assertContains(response, 'Пользователь: Mr.X')
+        # Сессия, пользователь и число постов автора.
+        with self.assertNumQueries(3):
+            response = reader_client.get(address)
+        self.assertNotContains(response, edit)
+        self.assertNotContains(response, '<!--hole:')
+        self.assertContains(response, 'Пользователь: Mr.Reader')
+        self.assertContains(response, 'Добавить комментарий')
+        response = self.client.get(address)
+        self.assertContains(response, 'Войти')
+        self.assertNotContains(response, 'Добавить комментарий')
+        response = reader_client.get(
+            reverse('posts:profile', args=(self.user.username,))
+        )
+        self.assertContains(response, 'Подписаться')
+        Follow.objects.create(user=reader, author=self.user)
+        response = reader_client.get(
+            reverse('posts:profile', args=(self.user.username,))
+        )
+        self.assertContains(response, 'Отписаться')
+
+    def test_cache_kept_on_signup(self):
+        """Регистрация не сбрасывает кеш страниц, смена имени сбрасывает."""
+        address = reverse('posts:index')
+        self.client.get(address)
+        User.objects.create_user(username='Mr.New')
+        with self.assertNumQueries(0):
+            self.client.get(address)
+        user = User.objects.get(pk=self.user.pk)
+        user.save(update_fields=('last_login',))
+        with self.assertNumQueries(0):
+            self.client.get(address)
+        user.first_name = 'Иван'
+        user.last_name = 'Петров'
+        user.save()
+        response = self.client.get(address)
+        self.assertContains(response, 'Автор: Иван Петров')
+
+    def test_follower_profile_invalidated(self):
+        """Подписка и отписка сбрасывают кеш профиля подписчика."""
+        follower = User.objects.create_user(username='Mr.Follower')
+        address = reverse('posts:profile', args=(follower.username,))
+        response = self.client.get(address)
+        self.assertContains(response, 'подписок: 0')
+        follow = Follow.objects.create(user=follower, author=self.user)
+        response = self.client.get(
+            address, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertContains(response, 'подписок: 1')
+        follow.delete()
+        response = self.client.get(
+            address, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertContains(response, 'подписок: 0')
+
+    def test_not_modified(self):
+        """Неизменившаяся страница отдаётся ответом 304 без отрисовки."""
+        post = Post.objects.create(author=self.user, text='Пост без правок')
+        address = reverse('posts:post_detail', args=(post.id,))
+        response = self.client.get(address)
+        etag = response['ETag']
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        # Поколения и время изменения берутся из кеша, а не из базы.
+        with self.assertNumQueries(0):
+            response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            address, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(
+            post=post, author=self.user, text='Новый комментарий'
+        )
+        response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новый комментарий')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_not_modified_per_user(self):
+        """ETag страницы зависит от пользователя, Last-Modified не шлётся."""
+        address = reverse('posts:profile', args=(self.user.username,))
+        etag = self.client.get(address)['ETag']
+        user_client = Client()
+        user_client.force_login(self.user)
+        response = user_client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        response = user_client.get(
+            address, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse('posts:profile', args=('nobody',)))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+
+class CommentPagesTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.post = Post.objects.create(
+            author=User.objects.create_user(username='Mr.X'),
+            text='Популярный пост',
+        )
+        for comment_num in range(settings.COMMENTS_PAGE + 5):
+            Comment.objects.create(
+                post=cls.post,
+                author=User.objects.create_user(username=f'User{comment_num}'),
+                text='Комментарий №%s!' % comment_num,
+            )
+
+    def test_post_detail_comments_page(self):
+        """Комментарии выводятся по страницам вместе с авторами."""
+        address = reverse('posts:post_detail', args=(self.post.id,))
+        # Пост, страница комментариев и число постов автора.
+        with self.assertNumQueries(3):
+            response = self.client.get(address)
+        comments = list(response.context['comments'])
+        self.assertEqual(len(comments), settings.COMMENTS_PAGE)
+        self.assertEqual(comments[0].text, 'Комментарий №24!')
+        next_cursor = response.context['comments'].paginator.next_cursor
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.id,)),
+            {'cursor': next_cursor},
+        )
+        more = list(response.context['comments'])
+        self.assertEqual(len(more), 5)
+        self.assertEqual(more[-1].text, 'Комментарий №0!')
+        self.assertNotContains(response, 'Показать ещё')
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Mr.X')
+        cls.best = Post.objects.create(
+            author=cls.user, text='Котики, котики и ещё раз котики'
+        )
+        for post_num in range(settings.PAGINATOR_PAGE + 2):
+            Post.objects.create(
+                author=cls.user, text='Пост №%s про котиков' % post_num
+            )
+        Post.objects.create(author=cls.user, text='Пост про собак')
+
+    def test_search_ranked_and_paginated(self):
+        """Поиск ранжирует посты по bm25 и выводит их по курсору."""
+        address = reverse('posts:post_search')
+        response = self.client.get(address, {'q': 'котик'})
+        page = response.context['page_obj']
+        self.assertEqual(page[0], self.best)
+        self.assertEqual(len(page), settings.PAGINATOR_PAGE)
+        response = self.client.get(
+            address, {'q': 'котик', 'cursor': page.paginator.next_cursor}
+        )
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(set(page) & set(second_page))
+        response = self.client.get(address, {'q': 'собак'})
+        self.assertEqual(len(response.context['page_obj']), 1)
+
+    def test_search_index_follows_changes(self):
+        """Индекс обновляется при изменении и удалении поста."""
+        post = Post.objects.create(author=self.user, text='Попугай')
+        self.assertEqual(search.post_ids('попугай', 10), [post.id])
+        post.text = 'Ворона'
+        post.save()
+        self.assertEqual(search.post_ids('попугай', 10), [])
+        self.assertEqual(search.post_ids('ворона', 10), [post.id])
+        post.delete()
+        self.assertEqual(search.post_ids('ворона', 10), [])
+        self.assertEqual(search.post_ids('"AND OR (', 10), [])
+
+    def test_rebuild_search_command(self):
+        """Команда rebuild_search индексирует посты без сигналов."""
+        Post.objects.bulk_create([
+            Post(author=self.user, text='Хомяк %s' % post_num)
+            for post_num in range(3)
+        ])
+        self.assertEqual(search.post_ids('хомяк', 10), [])
+        call_command('rebuild_search', batch_size=2, stdout=StringIO())
+        self.assertEqual(len(search.post_ids('хомяк', 10)), 3)
+        self.assertEqual(len(search.post_ids('котик', 100)), 13)
+
+    def test_admin_search(self):
+        """Поиск в админке идёт по полнотекстовому индексу."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        client = Client()
+        client.force_login(admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'собак'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list),
+            list(Post.objects.filter(text='Пост про собак')),
+        )
+
+
+class WarmCacheTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Mr.X')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание группы',
+        )
+        for post_num in range(settings.PAGINATOR_PAGE + 3):
+            Post.objects.create(
+                author=cls.user, text='Пост №%s!' % post_num, group=cls.group
+            )
+
+    def test_warm_cache_renders_pages(self):
+        """Прогретые страницы отдаются без запросов к базе."""
+        group_address = reverse('posts:group_posts', args=(self.group.slug,))
+        call_command(
+            'warm_cache', group_address, reverse('posts:index'),
+            pages=2, stdout=StringIO()
+        )
+        with self.assertNumQueries(0):
+            response = self.client.get(group_address)
+        cursor = warmup.NEXT_RE.search(response.content.decode()).group(1)
+        with self.assertNumQueries(0):
+            response = self.client.get(f'{group_address}?cursor={cursor}')
+        self.assertContains(response, 'Пост №0!')
+
+    @override_settings(WARM_CACHE_TRAFFIC_FLUSH=1)
+    def test_targets_from_traffic(self):
+        """Посещаемые страницы списков попадают в цели прогрева."""
+        address = reverse('posts:profile', args=(self.user.username,))
+        self.client.get(address)
+        self.assertIn(address, warmup.targets())
+        self.assertIn(reverse('posts:index'), warmup.targets())
 
 
 class FollowingTests(TestCase):
@@ -319,3 +877,318 @@ class FollowingTests(TestCase):
         response = authorized_client_2.get(reverse('posts:follow_index'))
         objects = response.context['page_obj']
         self.assertNotIn(post, objects)
+
+    def test_timeline_fan_out_and_prune(self):
+        """Проверка заполнения и очистки ленты подписок."""
+        old_post = Post.objects.create(
+            author=self.author,
+            text='Старый пост',
+        )
+        self.authorized_client_1.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}),
+        )
+        new_post = Post.objects.create(
+            author=self.author,
+            text='Новый пост',
+        )
+        timeline = TimelineEntry.objects.filter(user=self.follower_1)
+        self.assertEqual(
+            set(timeline.values_list('post_id', flat=True)),
+            {old_post.id, new_post.id}
+        )
+        response = self.authorized_client_1.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, old_post]
+        )
+        self.authorized_client_1.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.author}),
+        )
+        self.assertFalse(timeline.exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_timeline_popular_author_pull(self):
+        """Посты популярного автора попадают в ленту без раскладки."""
+        Follow.objects.create(user=self.follower_1, author=self.author)
+        post = Post.objects.create(
+            author=self.author,
+            text='Пост популярного автора',
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.follower_1).exists()
+        )
+        response = self.authorized_client_1.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_timeline_after_author_stops_being_popular(self):
+        """Посты времени популярности автора остаются в ленте после него."""
+        old_post = Post.objects.create(author=self.author, text='Старый пост')
+        follower_2 = User.objects.create_user(username='Mr.Z')
+        follower_3 = User.objects.create_user(username='Mr.W')
+        Follow.objects.create(user=follower_2, author=self.author)
+        # Второй подписчик делает автора популярным.
+        follow = Follow.objects.create(
+            user=self.follower_1, author=self.author
+        )
+        popular_post = Post.objects.create(
+            author=self.author, text='Пост популярного автора'
+        )
+        timeline = TimelineEntry.objects.filter(user=self.follower_1)
+        self.assertFalse(timeline.exists())
+        Follow.objects.filter(user=follower_2).delete()
+        self.assertEqual(
+            set(timeline.values_list('post_id', flat=True)),
+            {old_post.id, popular_post.id}
+        )
+        Follow.objects.create(user=follower_3, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        follower_3.delete()
+        self.assertEqual(
+            set(timeline.values_list('post_id', flat=True)),
+            {old_post.id, popular_post.id, new_post.id}
+        )
+        response = self.authorized_client_1.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [new_post, popular_post, old_post]
+        )
+        follow.delete()
+        self.assertFalse(timeline.exists())
+
+    def test_rebuild_timeline_command(self):
+        """Команда rebuild_timeline заполняет ленты старых подписок."""
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {num}')
+            for num in range(3)
+        ]
+        Follow.objects.create(user=self.follower_1, author=self.author)
+        # Подписка оформлена до появления таблицы лент.
+        TimelineEntry.objects.all().delete()
+        call_command(
+            'rebuild_timeline', batch_size=1, stdout=StringIO()
+        )
+        response = self.authorized_client_1.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), posts[::-1]
+        )
+
+
+class FeedStrategyTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.follower = User.objects.create_user(username='Mr.Y')
+        authors = [
+            User.objects.create_user(username=f'Author{num}')
+            for num in range(3)
+        ]
+        for author in authors:
+            Follow.objects.create(user=cls.follower, author=author)
+        for post_num in range(settings.PAGINATOR_PAGE * 2):
+            Post.objects.create(
+                author=authors[post_num % len(authors)],
+                text='Пост №%s!' % post_num,
+            )
+
+    def setUp(self):
+        feeds.recent_posts.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.follower)
+
+    def collect_feed(self):
+        posts = []
+        cursor = ''
+        while cursor is not None:
+            response = self.authorized_client.get(
+                reverse('posts:follow_index'), {'cursor': cursor}
+            )
+            posts.extend(response.context['page_obj'])
+            cursor = response.context['page_obj'].paginator.next_cursor
+        return posts
+
+    def test_strategies_return_same_feed(self):
+        """Все стратегии ленты подписок отдают одинаковые посты."""
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+        for strategy in feeds.FEED_STRATEGIES:
+            for ring_size in (4, settings.FEED_RING_SIZE):
+                with self.subTest(strategy=strategy, ring_size=ring_size):
+                    with self.settings(
+                        FOLLOW_FEED_STRATEGY=strategy,
+                        FEED_RING_SIZE=ring_size,
+                    ):
+                        feeds.recent_posts.clear()
+                        self.assertEqual(self.collect_feed(), expected)
+
+    @override_settings(FOLLOW_FEED_STRATEGY='merge')
+    def test_merge_feed_follows_signals(self):
+        """Буферы стратегии merge обновляются при создании и удалении."""
+        self.collect_feed()
+        author = User.objects.get(username='Author0')
+        post = Post.objects.create(author=author, text='Новый пост')
+        self.assertEqual(self.collect_feed()[0], post)
+        post.delete()
+        self.assertNotIn(post, self.collect_feed())
+
+    @override_settings(TIMELINE_FANOUT_BATCH=2)
+    def test_backfill_takes_all_posts(self):
+        """Новая подписка раскладывает в ленту все посты автора пачками."""
+        reader = User.objects.create_user(username='Mr.New')
+        author = User.objects.get(username='Author0')
+        Follow.objects.create(user=reader, author=author)
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(user=reader)
+                .values_list('post_id', flat=True)),
+            set(author.posts.values_list('id', flat=True)),
+        )
+
+    @override_settings(FOLLOW_FEED_STRATEGY='merge')
+    def test_merge_feed_sees_other_processes(self):
+        """Буфер перезагружается, если пост создан в другом процессе."""
+        self.collect_feed()
+        author = User.objects.get(username='Author1')
+        # У другого процесса свои буферы, а поколения в общем кеше.
+        with mock.patch.object(
+            feeds, 'recent_posts', feeds.RecentPostsIndex()
+        ):
+            post = Post.objects.create(author=author, text='Чужой пост')
+        self.assertEqual(self.collect_feed()[0], post)
+
+
+class ListingQueriesTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.follower = User.objects.create_user(username='Mr.Y')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание группы',
+        )
+        cls.author = User.objects.create_user(username='Author0')
+        Follow.objects.create(user=cls.follower, author=cls.author)
+        for post_num in range(settings.PAGINATOR_PAGE):
+            author = User.objects.create_user(username=f'User{post_num}')
+            Post.objects.create(
+                author=author, text='Пост №%s!' % post_num, group=cls.group
+            )
+            Post.objects.create(
+                author=cls.author, text='Пост №%s!' % post_num,
+                group=Group.objects.create(
+                    title=f'Группа {post_num}', slug=f'slug-{post_num}',
+                    description='Описание'
+                ),
+            )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.follower)
+
+    def test_listing_query_count(self):
+        """Число запросов страниц списков не зависит от числа постов."""
+        pages = (
+            (reverse('posts:index'), 1),
+            (reverse('posts:group_posts', args=(self.group.slug,)), 2),
+            (reverse('posts:profile', args=(self.author.username,)), 2),
+        )
+        for address, queries in pages:
+            with self.subTest(address=address):
+                with self.assertNumQueries(queries):
+                    self.client.get(address)
+        # Сессия, пользователь, подписки и страница ленты.
+        with self.assertNumQueries(4):
+            self.authorized_client.get(reverse('posts:follow_index'))
+
+
+class ApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='Mr.X', first_name='Икс', last_name='Иксов'
+        )
+        cls.reader = User.objects.create_user(username='Mr.Reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='api', description='Описание'
+        )
+        for post_num in range(settings.PAGINATOR_PAGE + 3):
+            Post.objects.create(
+                author=cls.author, text='Пост №%s!' % post_num,
+                group=cls.group,
+            )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def get_json(self, address, client=None, **params):
+        response = (client or self.client).get(address, params)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response, json.loads(b''.join(response.streaming_content))
+
+    def test_cursor_pages(self):
+        """API отдаёт ленты страницами по курсору."""
+        reader = Client()
+        reader.force_login(self.reader)
+        addresses = (
+            (reverse('posts:api_index'), self.client),
+            (reverse('posts:api_group_posts', args=(self.group.slug,)),
+             self.client),
+            (reverse('posts:api_profile', args=(self.author.username,)),
+             self.client),
+            (reverse('posts:api_follow_index'), reader),
+        )
+        for address, client in addresses:
+            with self.subTest(address=address):
+                _, data = self.get_json(address, client)
+                self.assertEqual(
+                    len(data['results']), settings.PAGINATOR_PAGE
+                )
+                self.assertEqual(data['results'][0]['text'], 'Пост №12!')
+                self.assertEqual(data['results'][0]['author'], {
+                    'username': 'Mr.X', 'name': 'Икс Иксов'
+                })
+                self.assertIsNone(data['previous'])
+                _, data = self.get_json(data['next'], client)
+                self.assertEqual(len(data['results']), 3)
+                self.assertEqual(data['results'][-1]['text'], 'Пост №0!')
+                self.assertIsNone(data['next'])
+
+    def test_fields_limit_columns(self):
+        """fields= ограничивает поля ответа и столбцы запроса."""
+        address = reverse('posts:api_index')
+        with CaptureQueriesContext(connection) as queries:
+            _, data = self.get_json(address, fields='id,text', limit=2)
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql']
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('comments_count', sql)
+        self.assertEqual(len(data['results']), 2)
+        self.assertEqual(set(data['results'][0]), {'id', 'text'})
+        self.assertIn('fields=id%2Ctext', data['next'])
+        response = self.client.get(address, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_not_modified(self):
+        """API отвечает 304, пока лента не изменилась."""
+        address = reverse('posts:api_group_posts', args=(self.group.slug,))
+        response, _ = self.get_json(address)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(author=self.author, text='Новый', group=self.group)
+        response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_requires_login(self):
+        """Лента подписок в API только для вошедших, подписка её меняет."""
+        address = reverse('posts:api_follow_index')
+        response = self.client.get(address)
+        self.assertEqual(response.status_code, 403)
+        reader = Client()
+        reader.force_login(self.reader)
+        etag = reader.get(address)['ETag']
+        Follow.objects.filter(user=self.reader).delete()
+        response = reader.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['results'], [])
@@ -0,0 +1,208 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections
+from django.templatetags.static import static
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import DummyImageFile, ImageFile
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import caching, media, variants
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+class Placeholder(DummyImageFile):
+    """Заглушка размера миниатюры, пока та создаётся в фоне."""
+
+    @property
+    def url(self):
+        return static(settings.THUMBNAIL_PLACEHOLDER)
+
+
+class BackgroundThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, который не создаёт миниатюры при рендеринге.
+
+    Готовая миниатюра берётся из хранилища ключей sorl, а если её ещё
+    нет, создание ставится в очередь пула потоков и вместо картинки
+    выводится заглушка. При THUMBNAIL_WORKERS = 0 и с базой в памяти
+    миниатюры создаются сразу, как в обычном бэкенде.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not background() or not file_:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        thumbnail = self.get_ready_thumbnail(
+            file_, geometry_string, dict(options)
+        )
+        if thumbnail is not None:
+            return thumbnail
+        schedule(getattr(file_, 'name', file_))
+        return Placeholder(geometry_string)
+
+    def get_ready_thumbnail(self, file_, geometry_string, options):
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, options)
+        )
+
+    def thumbnail_file(self, file_, geometry_string, options):
+        # Имя миниатюры считается так же, как в ThumbnailBackend.
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+
+class PrefetchKVStore(cached_db_kvstore.KVStore):
+    """Хранилище ключей sorl, умеющее загрузить записи пачкой.
+
+    prefetch() читает записи одним запросом к кешу и одним к базе и
+    запоминает их в потоке до первого чтения, так что теги {% thumbnail %}
+    страницы не обращаются к хранилищу по отдельности. Непрочитанные
+    записи забываются при следующем prefetch() и в конце запроса, чтобы
+    другой запрос этого потока не получил устаревшую миниатюру. Размеры
+    миниатюр хранятся в записях, поэтому файлы картинок не открываются.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.local = threading.local()
+
+    def forget(self):
+        self.local.values = {}
+
+    def prefetch(self, image_files):
+        self.forget()
+        keys = [add_prefix(image_file.key) for image_file in image_files]
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            found = dict(
+                KVStoreModel.objects.filter(key__in=missing)
+                .values_list('key', 'value')
+            )
+            for key in missing:
+                values[key] = found.get(key, cached_db_kvstore.EMPTY_VALUE)
+            self.cache.set_many(
+                {key: values[key] for key in missing},
+                sorl_settings.THUMBNAIL_CACHE_TIMEOUT,
+            )
+        self.local.values = values
+
+    def _get_raw(self, key):
+        values = getattr(self.local, 'values', {})
+        if key not in values:
+            return super()._get_raw(key)
+        value = values.pop(key)
+        if value == cached_db_kvstore.EMPTY_VALUE:
+            return None
+        return value
+
+
+def prefetch(files, geometry_string, **options):
+    """Загружает записи миниатюр картинок files одной пачкой."""
+    if not hasattr(default.kvstore, 'prefetch'):
+        return
+    backend = BackgroundThumbnailBackend()
+    default.kvstore.prefetch([
+        backend.thumbnail_file(file_, geometry_string, dict(options))
+        for file_ in files if file_
+    ])
+
+
+def forget_prefetched(**kwargs):
+    """Забывает записи миниатюр, загруженные для запроса, но не прочитанные."""
+    if hasattr(default.kvstore, 'forget'):
+        default.kvstore.forget()
+
+
+def background():
+    # Базу SQLite в памяти нельзя использовать из других потоков.
+    in_memory = getattr(connection, 'is_in_memory_db', lambda: False)
+    return settings.THUMBNAIL_WORKERS > 0 and not in_memory()
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def schedule(name):
+    """Ставит создание всех миниатюр картинки в очередь пула."""
+    if not name:
+        return
+    if not background():
+        generate(name)
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    executor().submit(run, name)
+
+
+def run(name):
+    try:
+        generate(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры %s', name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+        connections.close_all()
+
+
+def generate(name):
+    """Создаёт миниатюры всех размеров из POST_THUMBNAILS и варианты.
+
+    Если что-то было создано, сбрасывает закешированные карточки и
+    страницы постов с этой картинкой: в них могла остаться заглушка
+    или картинка без вариантов.
+    """
+    backend = BackgroundThumbnailBackend()
+    source = ImageFile(name, media.storage())
+    created = False
+    for geometry_string, options in settings.POST_THUMBNAILS:
+        ready = backend.get_ready_thumbnail(
+            source, geometry_string, dict(options)
+        )
+        if ready is None:
+            ThumbnailBackend.get_thumbnail(
+                backend, source, geometry_string, **options
+            )
+            created = True
+    if variants.generate(name):
+        created = True
+    if not created:
+        return
+    posts = Post.objects.filter(image=name).values_list(
+        'id', 'author__username', 'group__slug'
+    )
+    for post in posts:
+        caching.invalidate_cards(post_id=post[0])
+        caching.bump(*caching.post_namespaces(*post))
@@ -7,7 +7,18 @@ app_name = 'posts'
 urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
+    path('search/', views.post_search, name='post_search'),
     path('posts/<int:post_id>/', views.post_view, name='post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
+    path(
+        'images/<int:width>/<path:name>',
+        views.image_variant,
+        name='image_variant'
+    ),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
@@ -17,6 +28,18 @@ urlpatterns = [
         name='add_comment'
     ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('api/posts/', views.api_index, name='api_index'),
+    path(
+        'api/group/<slug:slug>/',
+        views.api_group_posts,
+        name='api_group_posts'
+    ),
+    path(
+        'api/profile/<str:username>/',
+        views.api_profile,
+        name='api_profile'
+    ),
+    path('api/follow/', views.api_follow_index, name='api_follow_index'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -1,9 +1,123 @@
+import base64
+import binascii
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+# Наибольшее значение целого в SQLite.
+MAX_PK = 2 ** 63 - 1
+
+
+def parse_date(value):
+    date = parse_datetime(value)
+    if date is None or is_naive(date):
+        raise ValueError(value)
+    return date
+
+
+def decode_cursor(cursor, parse=parse_date):
+    """Направление и позиция (ключ, id) из курсора.
+
+    parse разбирает ключ сортировки. Испорченный курсор, как и id вне
+    диапазона целых SQLite или дата без часового пояса, означает первую
+    страницу.
+    """
+    if not cursor:
+        return NEXT, None
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        direction, position = value[0], value[1:]
+        key, pk = position.rsplit('|', 1)
+        key, pk = parse(key), int(pk)
+    except (binascii.Error, UnicodeError, ValueError, IndexError,
+            OverflowError):
+        return NEXT, None
+    if direction not in (NEXT, PREVIOUS) or not 1 <= pk <= MAX_PK:
+        return NEXT, None
+    return direction, (key, pk)
 
 
-def paginator_func(request, posts):
-    paginator = Paginator(posts, settings.PAGINATOR_PAGE)
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу (pub_date, id).
+
+    Не выполняет COUNT(*) и не использует OFFSET: каждая страница -
+    это выборка per_page + 1 строк после (или до) курсора, поэтому
+    глубокие страницы стоят столько же, сколько первая.
+    """
+
+    cursor_mode = True
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-id')):
+        super().__init__(object_list, per_page)
+        self.ordering = ordering
+        self.fields = tuple(field.lstrip('-') for field in ordering)
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def encode_cursor(self, direction, obj):
+        date_field, id_field = self.fields
+        value = '{}{}|{}'.format(
+            direction,
+            getattr(obj, date_field).isoformat(),
+            getattr(obj, id_field),
+        )
+        return base64.urlsafe_b64encode(value.encode()).decode()
+
+    def page(self, cursor=None):
+        direction, position = decode_cursor(cursor)
+        date_field, id_field = self.fields
+        queryset = self.object_list
+        if position is None:
+            queryset = queryset.order_by(*self.ordering)
+        else:
+            date, pk = position
+            lookup = 'lt' if direction == NEXT else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{date_field}__{lookup}': date})
+                | Q(**{date_field: date, f'{id_field}__{lookup}': pk})
+            )
+            if direction == NEXT:
+                queryset = queryset.order_by(*self.ordering)
+            else:
+                queryset = queryset.order_by(*self.fields)
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == PREVIOUS:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+        if rows and has_next:
+            self.next_cursor = self.encode_cursor(NEXT, rows[-1])
+        if rows and has_previous:
+            self.previous_cursor = self.encode_cursor(PREVIOUS, rows[0])
+        return Page(rows, 1, self)
+
+
+def paginator_func(request, posts, ordering=('-pub_date', '-id')):
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    if page_number is not None or not settings.PAGINATOR_CURSOR:
+        # Старые ссылки вида ?page=N продолжают работать.
+        paginator = Paginator(
+            posts.order_by(*ordering), settings.PAGINATOR_PAGE
+        )
+        return paginator.get_page(page_number)
+    paginator = CursorPaginator(posts, settings.PAGINATOR_PAGE, ordering)
+    return paginator.page(request.GET.get('cursor'))
+
+
+def comments_func(request, comments):
+    paginator = CursorPaginator(
+        comments.select_related('author'),
+        settings.COMMENTS_PAGE,
+        ('-created', '-id'),
+    )
+    return paginator.page(request.GET.get('cursor'))
@@ -0,0 +1,163 @@
+import io
+import logging
+import os
+import posixpath
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from .images import EXTENSIONS, has_alpha
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'variants'
+
+
+def formats(name):
+    """Форматы вариантов картинки name по убыванию предпочтения.
+
+    Современные форматы из IMAGE_VARIANT_FORMATS берутся, только если
+    Pillow умеет их сохранять. Последний формат понимают все браузеры:
+    JPEG, а для картинок, сохранённых с прозрачностью, - PNG.
+    """
+    Image.init()
+    modern = [
+        image_format for image_format in settings.IMAGE_VARIANT_FORMATS
+        if image_format in Image.SAVE
+    ]
+    extension = posixpath.splitext(name)[1].lower()
+    legacy = 'JPEG' if extension in ('.jpg', '.jpeg') else 'PNG'
+    return modern + [legacy]
+
+
+def mime_type(image_format):
+    return Image.MIME.get(image_format, f'image/{image_format.lower()}')
+
+
+def widths(image_width):
+    """Пары (ширина в имени, настоящая ширина) вариантов картинки.
+
+    Картинка не увеличивается: из ширин IMAGE_VARIANT_WIDTHS, которые
+    больше неё, остаётся одна, и этот вариант равен ей по ширине.
+    """
+    result = []
+    for width in settings.IMAGE_VARIANT_WIDTHS:
+        result.append((width, min(width, image_width)))
+        if width >= image_width:
+            break
+    return result
+
+
+def variant_name(name, width, image_format):
+    stem = posixpath.splitext(name)[0]
+    return posixpath.join(PREFIX, stem, f'{width}{EXTENSIONS[image_format]}')
+
+
+def accepted_types(accept):
+    """Типы из заголовка Accept с ненулевым q."""
+    types = set()
+    for item in accept.split(','):
+        media_type, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            types.add(media_type.strip().lower())
+    return types
+
+
+def negotiate(accept, name):
+    """Формат варианта для клиента с заголовком Accept.
+
+    Современный формат выбирается, только если клиент назвал его явно:
+    */* в Accept не означает, что браузер умеет показывать AVIF.
+    """
+    *modern, legacy = formats(name)
+    types = accepted_types(accept)
+    for image_format in modern:
+        if mime_type(image_format) in types:
+            return image_format
+    return legacy
+
+
+def open_image(name):
+    """Открывает картинку поста; None, если файла нет или он анимирован."""
+    try:
+        storage = Post._meta.get_field('image').storage
+        with storage.open(name) as source:
+            image = Image.open(source)
+            if getattr(image, 'is_animated', False):
+                return None
+            image.load()
+    except (OSError, SuspiciousFileOperation):
+        logger.warning('Не удалось открыть картинку %s', name)
+        return None
+    return image
+
+
+def encode(image, width, image_format):
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.LANCZOS)
+    options = {'quality': settings.IMAGE_VARIANT_QUALITY}
+    if image_format == 'JPEG':
+        image = image.convert('RGB')
+        options.update(progressive=True, optimize=True)
+    elif has_alpha(image):
+        image = image.convert('RGBA')
+    else:
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, image_format, **options)
+    return ContentFile(output.getvalue())
+
+
+def save_variant(image, name, width, image_format):
+    """Кодирует вариант, если его ещё нет на диске, и возвращает имя."""
+    variant = variant_name(name, width, image_format)
+    if not default_storage.exists(variant):
+        default_storage.save(variant, encode(image, width, image_format))
+    return variant
+
+
+def generate(name):
+    """Создаёт все варианты картинки и записывает её размеры в посты.
+
+    Возвращает True, если размеры записаны впервые: с ними шаблоны
+    выводят <picture> со ссылками на готовые файлы вариантов.
+    """
+    image = open_image(name)
+    if image is None:
+        return False
+    for width, _ in widths(image.width):
+        for image_format in formats(name):
+            save_variant(image, name, width, image_format)
+    return bool(
+        Post.objects.filter(image=name)
+        .exclude(image_width=image.width, image_height=image.height)
+        .update(image_width=image.width, image_height=image.height)
+    )
+
+
+def delete(name):
+    """Удаляет все варианты картинки."""
+    directory = posixpath.join(PREFIX, posixpath.splitext(name)[0])
+    try:
+        _, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        default_storage.delete(posixpath.join(directory, filename))
+    try:
+        os.rmdir(default_storage.path(directory))
+    except OSError:
+        pass
@@ -1,48 +1,76 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.files.storage import default_storage
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_safe
 
+from core.media import serve_file
+
+from . import api, feeds, images, search, stats, variants
+from .caching import cache_listing, conditional
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
-from .utils import paginator_func
+from .models import Comment, Follow, Group, Post, StoredFile, User
+from .utils import comments_func, paginator_func
 
 
-@cache_page(20)
+@cache_listing('index', 'groups', 'users')
 def index(request):
-    posts = Post.objects.select_related('group').all()
+    posts = Post.objects.for_listing()
     page_obj = paginator_func(request, posts)
     return render(request, 'posts/index.html', {'page_obj': page_obj})
 
 
+@conditional(max_age=settings.LISTING_MAX_AGE)
+@cache_listing('group:{slug}', 'users')
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    posts = group.posts.for_listing()
     page_obj = paginator_func(request, posts)
     return render(
         request, 'posts/group_list.html',
         {'group': group, 'page_obj': page_obj})
 
 
+@conditional(max_age=settings.LISTING_MAX_AGE)
+@cache_listing('profile:{username}', 'groups', 'users')
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    if not hasattr(author, 'stats'):
+        author.stats = stats.get(author.pk)
+    posts = author.posts.for_listing()
     page_obj = paginator_func(request, posts)
-    following = False
-    if request.user.is_authenticated:
-        following = (
-            Follow.objects.filter(user=request.user, author=author).exists()
-        )
     context = {
         'author': author,
         'page_obj': page_obj,
-        'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@cache_listing('index', 'groups', 'users')
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = search.SearchPaginator(
+        Post.objects.for_listing(), query, settings.PAGINATOR_PAGE
+    )
+    page_obj = paginator.page(request.GET.get('cursor'))
+    return render(
+        request, 'posts/search.html',
+        {'query': query, 'page_obj': page_obj}
+    )
+
+
+# Число постов автора меняется вместе с главной страницей.
+@conditional('index')
+@cache_listing('post:{post_id}', 'groups', 'users')
 def post_view(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id
+    )
+    comments = comments_func(request, post.comments)
     form = CommentForm()
     context = {
         'comments': comments,
@@ -52,6 +80,44 @@ def post_view(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+@cache_listing('post:{post_id}', 'users')
+def post_comments(request, post_id):
+    comments = comments_func(request, Comment.objects.filter(post=post_id))
+    return render(
+        request, 'includes/comment_list.html',
+        {'comments': comments, 'post_id': post_id}
+    )
+
+
+@require_safe
+def image_variant(request, width, name):
+    """Вариант картинки поста в лучшем формате из принимаемых клиентом.
+
+    Варианты кодируются один раз и хранятся на диске; отсутствующий
+    вариант известной картинки создаётся при первом запросе.
+    """
+    if width not in settings.IMAGE_VARIANT_WIDTHS:
+        raise Http404
+    image_format = variants.negotiate(
+        request.META.get('HTTP_ACCEPT', ''), name
+    )
+    variant = variants.variant_name(name, width, image_format)
+    if not default_storage.exists(variant):
+        if not StoredFile.objects.filter(name=name).exists():
+            raise Http404
+        image = variants.open_image(name)
+        if image is None:
+            raise Http404
+        variants.save_variant(image, name, width, image_format)
+    # Имена картинок - хеши содержимого, файл по адресу не меняется.
+    response = serve_file(
+        request, default_storage.path(variant),
+        content_type=variants.mime_type(image_format), is_immutable=True,
+    )
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None,)
@@ -59,7 +125,12 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
-        return redirect('posts:profile', post.author)
+        response = redirect('posts:profile', post.author)
+        if form.image_timings:
+            response['Server-Timing'] = images.server_timing(
+                form.image_timings
+            )
+        return response
     return render(request, 'posts/post_create.html', {'form': form})
 
 
@@ -74,8 +145,18 @@ def post_edit(request, post_id):
         instance=post
     )
     if form.is_valid():
-        form.save()
-        return redirect('posts:post_detail', post_id=post.id)
+        # Не перезаписываем счётчик комментариев устаревшим значением.
+        fields = list(PostForm.Meta.fields)
+        if 'image' in form.changed_data:
+            # Размеры прежней картинки сброшены сигналом pre_save.
+            fields += ['image_width', 'image_height']
+        form.save(commit=False).save(update_fields=fields)
+        response = redirect('posts:post_detail', post_id=post.id)
+        if form.image_timings:
+            response['Server-Timing'] = images.server_timing(
+                form.image_timings
+            )
+        return response
     return render(
         request, 'posts/post_create.html',
         {'form': form}
@@ -96,14 +177,49 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginator_func(request, posts)
+    posts = feeds.follow_feed(request).for_listing()
+    page_obj = paginator_func(request, posts, feeds.FEED_ORDERING)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/follow.html', context)
 
 
+@require_safe
+@conditional('index', 'groups', 'users')
+def api_index(request):
+    return api.listing(request, Post.objects.all())
+
+
+@require_safe
+@conditional('group:{slug}', 'users')
+def api_group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).first()
+    if group is None:
+        return api.error('Группа не найдена.', 404)
+    return api.listing(request, group.posts.all())
+
+
+@require_safe
+@conditional('profile:{username}', 'groups', 'users')
+def api_profile(request, username):
+    author = User.objects.filter(username=username).first()
+    if author is None:
+        return api.error('Автор не найден.', 404)
+    return api.listing(request, author.posts.all())
+
+
+@require_safe
+@conditional('index', 'feed:{request.user.pk}', 'groups', 'users')
+def api_follow_index(request):
+    if not request.user.is_authenticated:
+        return api.error('Лента доступна после входа на сайт.', 403)
+    posts = feeds.follow_feed(
+        request, api.parse_limit(request.GET.get('limit'))
+    )
+    return api.listing(request, posts, feeds.FEED_ORDERING)
+
+
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
@@ -0,0 +1,100 @@
+import re
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import Resolver404, resolve, reverse
+
+TRAFFIC_KEY = 'posts:traffic'
+
+NEXT_RE = re.compile(r'rel="next" href="\?cursor=([\w=-]+)"')
+
+_hits = Counter()
+_hits_lock = threading.Lock()
+
+
+def record(request):
+    """Учитывает запрос страницы списка в статистике посещений.
+
+    Счётчики копятся в памяти процесса и раз в WARM_CACHE_TRAFFIC_FLUSH
+    запросов добавляются в общий кеш, старые значения при этом
+    уменьшаются вдвое, так что наверху остаются недавно популярные пути.
+    """
+    if getattr(request, 'warming', False):
+        return
+    with _hits_lock:
+        _hits[request.path] += 1
+        if sum(_hits.values()) < settings.WARM_CACHE_TRAFFIC_FLUSH:
+            return
+        hits = _hits.copy()
+        _hits.clear()
+    traffic = Counter({
+        path: count // 2
+        for path, count in (cache.get(TRAFFIC_KEY) or {}).items()
+    })
+    traffic.update(hits)
+    cache.set(TRAFFIC_KEY, dict(
+        traffic.most_common(settings.WARM_CACHE_TRAFFIC_PATHS)
+    ), None)
+
+
+def targets():
+    """Пути для прогрева: главная, настройки и самые посещаемые."""
+    paths = [reverse('posts:index'), *settings.WARM_CACHE_TARGETS]
+    traffic = Counter(cache.get(TRAFFIC_KEY) or {})
+    paths.extend(
+        path for path, _ in
+        traffic.most_common(settings.WARM_CACHE_TRAFFIC_PATHS)
+    )
+    return list(dict.fromkeys(paths))
+
+
+def warm_path(path, pages):
+    """Рендерит и кеширует первые pages страниц списка.
+
+    Возвращает число отрисованных страниц. Миниатюры картинок создаются
+    при рендеринге карточек постов.
+    """
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return 0
+    if not getattr(match.func, 'cache_namespaces', None):
+        return 0
+    factory = RequestFactory()
+    cursor = None
+    for page in range(pages):
+        # Курсор подставляется как в ссылке пагинатора, без кодирования,
+        # чтобы ключ кеша совпал с ключом страницы, открытой по ссылке.
+        request = factory.get(f'{path}?cursor={cursor}' if cursor else path)
+        request.user = AnonymousUser()
+        request.resolver_match = match
+        request.warming = True
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.status_code != 200:
+            return page
+        found = NEXT_RE.search(response.content.decode(response.charset))
+        if found is None:
+            return page + 1
+        cursor = found.group(1)
+    return pages
+
+
+def warm(paths=None, pages=None):
+    paths = targets() if paths is None else paths
+    pages = pages or settings.WARM_CACHE_PAGES
+    return {path: warm_path(path, pages) for path in paths}
+
+
+def warm_in_background():
+    def run():
+        try:
+            warm()
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=run, name='warm-cache', daemon=True).start()
@@ -100,6 +100,44 @@ USE_L10N = True
 
 USE_TZ = True
 
+# Миниатюры создаются в фоне при загрузке картинки, пока их нет -
+# выводится заглушка. Здесь перечислены все размеры из шаблонов.
+THUMBNAIL_BACKEND = 'posts.thumbnails.BackgroundThumbnailBackend'
+
+# Записи о миниатюрах не меняются, их можно читать сразу из общего кеша
+# и загружать пачкой на страницу.
+THUMBNAIL_KVSTORE = 'posts.thumbnails.PrefetchKVStore'
+
+THUMBNAIL_CACHE = 'shared'
+
+POST_THUMBNAILS = (
+    ('100x100', {'crop': 'center'}),
+    ('300x300', {'crop': 'center'}),
+)
+
+THUMBNAIL_WORKERS = 2
+
+THUMBNAIL_PLACEHOLDER = 'img/placeholder.svg'
+
+# Загруженные картинки поворачиваются по EXIF, уменьшаются и
+# перекодируются без метаданных в пуле из IMAGE_WORKERS процессов.
+IMAGE_WORKERS = 2
+
+IMAGE_MAX_SIZE = 2048
+
+IMAGE_FORMAT = 'JPEG'
+
+IMAGE_QUALITY = 85
+
+# Варианты картинки поста разной ширины для srcset: в современных
+# форматах, которые умеет сохранять Pillow, и в JPEG (PNG для картинок
+# с прозрачностью).
+IMAGE_VARIANT_WIDTHS = (320, 640, 960, 1280)
+
+IMAGE_VARIANT_FORMATS = ('AVIF', 'WEBP')
+
+IMAGE_VARIANT_QUALITY = 80
+
 
 STATIC_URL = '/static/'
 
@@ -118,6 +156,31 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 MEDIA_URL = '/media/'
 
+# Медиафайлы отдаются с ETag и Last-Modified и по диапазонам байтов.
+# Файлы с хешем содержимого в имени не меняются и кешируются на год.
+MEDIA_MAX_AGE = 60 * 60
+
+MEDIA_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+MEDIA_IMMUTABLE_PATTERN = r'(^|/)[0-9a-f]{32,}[./]'
+
+# Отдачу файла можно передать веб-серверу: 'x-accel-redirect' для nginx
+# (internal-location MEDIA_ACCEL_PREFIX смотрит в MEDIA_ROOT) или
+# 'x-sendfile' для Apache и lighttpd.
+MEDIA_ACCEL = None
+
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Сборка мусора в MEDIA_ROOT (manage.py gc_media) не трогает файлы моложе
+# MEDIA_GC_MIN_AGE секунд: на них может ещё не успеть сослаться пост.
+MEDIA_GC_MIN_AGE = 60 * 60
+
+MEDIA_GC_CHECKPOINT = os.path.join(BASE_DIR, 'media_gc.json')
+
+# Файл картинки, который загрузили снова за последние MEDIA_REUSE_GRACE
+# секунд, не удаляется вместе с последней ссылкой: его оставляют gc_media.
+MEDIA_REUSE_GRACE = 60
+
 LOGIN_URL = 'users:login'
 
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -128,10 +191,85 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 PAGINATOR_PAGE = 10
 
+PAGINATOR_CURSOR = True
+
+COMMENTS_PAGE = 20
+
+# Наибольший размер страницы JSON API (параметр limit=).
+API_PAGE_MAX = 100
+
+# Лента подписок: посты раскладываются по лентам подписчиков пачками,
+# у авторов с числом подписчиков больше лимита посты читаются напрямую.
+TIMELINE_FANOUT_BATCH = 1000
+
+TIMELINE_FANOUT_LIMIT = 10000
+
+# Стратегия ленты подписок: 'sql', 'materialized' или 'merge'
+# (слияние буферов последних постов авторов в памяти процесса).
+# Ленты для подписок, оформленных до 'materialized', заполняет
+# manage.py rebuild_timeline.
+FOLLOW_FEED_STRATEGY = 'materialized'
+
+FEED_RING_SIZE = 100
+
+FEED_RING_AUTHORS = 10000
+
+# Кеш в файле SQLite общий для всех процессов WSGI-сервера на хосте,
+# перед ним - небольшой кеш в памяти каждого процесса.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.tiered.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+            'IMMUTABLE_NAMESPACES': ['posts:page', 'posts:card'],
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.sqlite.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
 
+# Тесты работают со своими файлами кешей во временном каталоге и очищают
+# кеши перед каждым тестом.
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+# Страницы лент сбрасываются сигналами при изменении данных,
+# поэтому могут храниться долго.
+LISTING_CACHE_TIMEOUT = 60 * 60 * 6
+
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Сколько секунд браузер и прокси могут не проверять гостевые страницы
+# групп и профилей; остальные страницы проверяются при каждом показе.
+LISTING_MAX_AGE = 60
+
+# Защита от одновременного пересчёта: пока один процесс пересчитывает
+# запись, остальные до CACHE_STALE_TIMEOUT секунд получают прежнюю.
+CACHE_LOCK_TIMEOUT = 10
+
+CACHE_LOCK_POLL = 0.05
+
+CACHE_STALE_TIMEOUT = 60 * 60
+
+CACHE_EARLY_BETA = 1.0
+
+# Прогрев кеша: первые WARM_CACHE_PAGES страниц главной, путей из
+# WARM_CACHE_TARGETS и самых посещаемых страниц списков.
+WARM_CACHE_PAGES = 3
+
+WARM_CACHE_TARGETS = []
+
+WARM_CACHE_TRAFFIC_PATHS = 20
+
+WARM_CACHE_TRAFFIC_FLUSH = 100
+
+# Прогревать кеш в фоне при первом запросе к процессу.
+WARM_CACHE_ON_START = False
+
 USE_TZ = True
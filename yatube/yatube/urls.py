@@ -1,8 +1,11 @@
+import re
+
 from django.conf.urls import handler403
 from django.contrib import admin
 from django.conf import settings
-from django.urls import include, path
-from django.conf.urls.static import static
+from django.urls import include, path, re_path
+
+from core.views import media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -10,13 +13,13 @@ urlpatterns = [
     path('auth/', include('users.urls', namespace='users')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    re_path(
+        r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')),
+        media,
+        name='media'
+    ),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )
-
 handler403 = 'core.views.permission_denied'
 handler404 = 'core.views.page_not_found'
 handler500 = 'core.views.server_error'